@@ -0,0 +1,433 @@
+# local audio analysis, an alternative to spotify_client.py that needs no
+# account or network
+# a WAV file is read a chunk at a time, averaged down to mono at about
+# SAMPLE_RATE, cut into overlapping frames and run through the FFT chunk by
+# chunk, so only a handful of numbers per frame (loudness, onset strength,
+# chroma and band energies) are kept for the whole song. onsets, tempo,
+# beats, tatums, bars and coarse sections are found from those and returned
+# in the shape of Spotify's audio_analysis, so driver.py and the rest can't
+# tell the difference. run as
+#   python analyzer.py song.wav [audio_analysis.json]
+
+import json
+import sys
+import time
+import wave
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# audio is averaged down to about this rate before analysis, Hz
+SAMPLE_RATE = 22050
+# fft frame and hop in samples at SAMPLE_RATE, about 46ms and 12ms
+FRAME = 1024
+HOP = 256
+# samples read from the file at once, before averaging down
+CHUNK = 1 << 16
+
+# loudness floor, dB
+SILENCE = -60.0
+# onsets closer than this are one segment, seconds
+MIN_SEGMENT = 0.1
+# how far above the local mean onset strength an onset has to be, in
+# standard deviations
+ONSET_THRESHOLD = 0.5
+# range the tempo is searched in and the tempo it is pulled towards, bpm.
+# TEMPO_SPREAD is how wide the pull is, in octaves
+MIN_TEMPO = 60
+MAX_TEMPO = 200
+PREFERRED_TEMPO = 120
+TEMPO_SPREAD = 1.0
+# beats may land this share of a beat off the tempo grid to sit on an onset
+BEAT_SLACK = 0.1
+TIME_SIGNATURE = 4
+# bars compared either side of a candidate section boundary, and the
+# shortest section, in bars
+SECTION_CONTEXT = 4
+MIN_SECTION = 8
+
+# lowest and highest frequency mapped to a pitch class, Hz
+PITCH_RANGE = (55.0, 5000.0)
+# log spaced bands the timbre coefficients are taken from
+BANDS = 12
+LOWEST_BAND = 40.0
+
+# Krumhansl-Kessler key profiles, C first
+MAJOR = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+TINY = 1e-12
+
+
+# WAV sample bytes of the given width as floats in [-1, 1)
+def decode(raw, width):
+    if width == 1:
+        return (np.frombuffer(raw, np.uint8) - 128.0) / 128
+    if width == 3:
+        b = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        return ints / float(1 << 23)
+    dtype = {2: '<i2', 4: '<i4'}[width]
+    return np.frombuffer(raw, dtype) / float(1 << (8 * width - 1))
+
+
+# (rate, duration, chunks) of a WAV file, the chunks being mono float arrays
+# averaged down by a whole factor to about SAMPLE_RATE
+def read(path, chunk=CHUNK):
+    audio = wave.open(path, 'rb')
+    rate = audio.getframerate()
+    channels = audio.getnchannels()
+    width = audio.getsampwidth()
+    factor = max(1, int(round(rate / SAMPLE_RATE)))
+    chunk -= chunk % factor
+
+    def chunks():
+        with audio:
+            while True:
+                raw = audio.readframes(chunk)
+                if not raw:
+                    return
+                samples = decode(raw, width).reshape(-1, channels).mean(axis=1)
+                samples = samples[:len(samples) - len(samples) % factor]
+                yield samples.reshape(-1, factor).mean(axis=1)
+
+    return rate / factor, audio.getnframes() / rate, chunks()
+
+
+# frames of FRAME samples every HOP samples, as one array per chunk. the
+# tail of each chunk is carried over into the next. the audio is preceded by
+# half a frame of silence so frame i is centred on sample i * HOP
+def frames(chunks):
+    carry = np.zeros(FRAME // 2)
+    for chunk in chunks:
+        buffer = np.concatenate([carry, chunk])
+        count = (len(buffer) - FRAME) // HOP + 1
+        if count <= 0:
+            carry = buffer
+            continue
+        yield sliding_window_view(buffer, FRAME)[::HOP][:count]
+        carry = buffer[count * HOP:]
+
+
+# fft bin -> pitch class and fft bin -> band matrices, shape (bins, 12)
+def filters(rate):
+    freqs = np.fft.rfftfreq(FRAME, 1 / rate)
+    chroma = np.zeros((len(freqs), 12))
+    audible = (freqs >= PITCH_RANGE[0]) & (freqs <= PITCH_RANGE[1])
+    pitch = np.round(12 * np.log2(freqs[audible] / 440.0) + 9).astype(int) % 12
+    chroma[np.flatnonzero(audible), pitch] = 1
+
+    edges = np.geomspace(LOWEST_BAND, rate / 2, BANDS + 1)
+    band = np.searchsorted(edges, freqs, side='right') - 1
+    bands = np.zeros((len(freqs), BANDS))
+    inside = (band >= 0) & (band < BANDS)
+    bands[np.flatnonzero(inside), band[inside]] = 1
+    return chroma, bands
+
+
+# per frame loudness (dB), onset strength, chroma and log band energies,
+# computed a chunk of frames at a time
+def frame_features(chunks, rate):
+    window = np.hanning(FRAME)
+    chroma_filter, band_filter = filters(rate)
+    previous = None
+    loudness, flux, chroma, bands = [], [], [], []
+    for block in frames(chunks):
+        spectrum = np.abs(np.fft.rfft(block * window, axis=1))
+        power = spectrum ** 2
+        compressed = np.log1p(100 * spectrum)
+        # the audio rises out of silence
+        if previous is None:
+            previous = np.zeros_like(compressed[:1])
+        rises = np.diff(np.vstack([previous, compressed]), axis=0)
+        previous = compressed[-1:]
+
+        loudness.append(10 * np.log10(np.mean(block ** 2, axis=1) + TINY))
+        flux.append(np.maximum(rises, 0).sum(axis=1))
+        chroma.append(power @ chroma_filter)
+        bands.append(10 * np.log10(power @ band_filter + TINY))
+    if not loudness:
+        raise ValueError('audio is shorter than one analysis frame')
+    return (np.maximum(np.concatenate(loudness), SILENCE),
+            np.concatenate(flux), np.vstack(chroma), np.vstack(bands))
+
+
+# values averaged over +-radius around every index
+def moving_average(values, radius):
+    kernel = np.ones(2 * radius + 1) / (2 * radius + 1)
+    return np.convolve(np.pad(values, radius, mode='edge'), kernel, 'valid')
+
+
+# indices of the maxima over +-distance that are above threshold
+def peaks(values, distance, threshold):
+    padded = np.pad(values, distance, constant_values=-np.inf)
+    highest = sliding_window_view(padded, 2 * distance + 1).max(axis=1)
+    found = np.flatnonzero((values >= highest) & (values > threshold))
+    # plateaus give several maxima, keep the first of each
+    if len(found):
+        found = found[np.diff(found, prepend=-distance - 1) > distance]
+    return found
+
+
+# onset strength above its local mean, normalized to a maximum of 1
+def onset_envelope(flux, fps):
+    onset = np.maximum(flux - moving_average(flux, max(1, int(fps * 0.1))), 0)
+    return onset / (onset.max() + TINY)
+
+
+# (beat period in frames, confidence) from the autocorrelation of the onset
+# envelope, weighted towards PREFERRED_TEMPO
+def beat_period(onset, fps):
+    centred = onset - onset.mean()
+    spectrum = np.fft.rfft(centred, 2 * len(centred))
+    correlation = np.fft.irfft(np.abs(spectrum) ** 2)[:len(centred)]
+    lags = np.arange(int(60 * fps / MAX_TEMPO), int(60 * fps / MIN_TEMPO) + 1)
+    lags = lags[(lags > 0) & (lags < len(correlation) - 1)]
+    if not len(lags):
+        return 60 * fps / PREFERRED_TEMPO, 0.0
+    bpm = 60 * fps / lags
+    weight = np.exp(-0.5 * (np.log2(bpm / PREFERRED_TEMPO) / TEMPO_SPREAD) ** 2)
+    best = lags[np.argmax(correlation[lags] * weight)]
+
+    # parabolic interpolation for a period between frames
+    a, b, c = correlation[best - 1:best + 2]
+    shift = 0.5 * (a - c) / (a - 2 * b + c) if a - 2 * b + c < 0 else 0.0
+    confidence = max(0.0, min(1.0, b / (correlation[0] + TINY)))
+    return best + shift, confidence
+
+
+# frames the beats fall on: the phase of the tempo grid that hits the most
+# onset strength, with every beat moved onto the strongest onset within
+# BEAT_SLACK of where the grid puts it
+def track_beats(onset, period):
+    count = len(onset)
+    phases = np.arange(int(period))
+    grid = phases[:, None] + np.arange(int(count / period) + 1) * period
+    grid = np.round(grid).astype(int)
+    scores = np.where(grid < count, onset[np.minimum(grid, count - 1)], 0)
+    position = float(phases[scores.sum(axis=1).argmax()])
+
+    slack = max(1, int(period * BEAT_SLACK))
+    beats = []
+    while position < count:
+        low = max(0, int(round(position)) - slack)
+        high = min(count, int(round(position)) + slack + 1)
+        beat = low + int(onset[low:high].argmax())
+        if beats and beat <= beats[-1]:
+            beat = int(round(position))
+        beats.append(beat)
+        position = beat + period
+    return np.array(beats)
+
+
+# (key, key confidence, mode, mode confidence) of a chroma vector, by
+# correlation with the major and minor profiles in every key
+def key_of(chroma):
+    profiles = np.array([np.roll(profile, key) for profile in (MINOR, MAJOR)
+                         for key in range(12)], dtype=float)
+    profiles = (profiles - profiles.mean(axis=1, keepdims=True)) / \
+        profiles.std(axis=1, keepdims=True)
+    chroma = (chroma - chroma.mean()) / (chroma.std() + TINY)
+    scores = (profiles @ chroma / 12).reshape(2, 12)
+    mode, key = np.unravel_index(scores.argmax(), scores.shape)
+    key_confidence = max(0.0, min(1.0, scores[mode, key]))
+    mode_confidence = max(0.0, min(1.0, scores[mode, key] -
+                                   scores[1 - mode, key]))
+    return int(key), key_confidence, int(mode), mode_confidence
+
+
+# the 12 timbre coefficients of a row of log band energies
+def timbre_of(bands):
+    k = np.arange(BANDS)
+    basis = np.cos(np.pi / BANDS * (k[None, :] + 0.5) * k[:, None])
+    return basis @ bands / BANDS
+
+
+def rounded(value, decimals=5):
+    return round(float(value), decimals)
+
+
+# spans with the given starts and an end, as Spotify's start/duration/
+# confidence dicts
+def spans(starts, end, confidences):
+    ends = np.append(starts[1:], end)
+    return [{'start': rounded(start), 'duration': rounded(stop - start),
+             'confidence': rounded(confidence, 3)}
+            for start, stop, confidence in zip(starts, ends, confidences)]
+
+
+def segments_of(onsets, loudness, chroma, bands, strength, fps):
+    bounds = np.concatenate([[0], onsets[onsets > 0]])
+    ends = np.append(bounds[1:], len(loudness))
+    sizes = (ends - bounds)[:, None]
+    pitches = np.add.reduceat(chroma, bounds) / sizes
+    pitches /= pitches.max(axis=1, keepdims=True) + TINY
+    timbre = timbre_of((np.add.reduceat(bands, bounds) / sizes).T).T
+
+    segments = []
+    for i, (start, end) in enumerate(zip(bounds, ends)):
+        peak = start + int(loudness[start:end].argmax())
+        segments.append({
+            'start': rounded(start / fps),
+            'duration': rounded((end - start) / fps),
+            'confidence': rounded(strength[start] if i else 0.0, 3),
+            'loudness_start': rounded(loudness[start], 3),
+            'loudness_max': rounded(loudness[peak], 3),
+            'loudness_max_time': rounded((peak - start) / fps),
+            'pitches': [rounded(p, 3) for p in pitches[i]],
+            'timbre': [rounded(t, 3) for t in timbre[i]],
+        })
+    return segments
+
+
+# bar indices where sections start: bars where the music of the
+# SECTION_CONTEXT bars before and after differs most, strongest first, at
+# least MIN_SECTION bars apart
+def section_starts(bar_features):
+    count = len(bar_features)
+    rows = bar_features - bar_features.mean(axis=0)
+    rows /= rows.std(axis=0) + TINY
+    cumulative = np.vstack([np.zeros(rows.shape[1]), np.cumsum(rows, axis=0)])
+    k = SECTION_CONTEXT
+    candidates = np.arange(max(k, MIN_SECTION), count - max(k, MIN_SECTION) + 1)
+    if not len(candidates):
+        return [0]
+    before = (cumulative[candidates] - cumulative[candidates - k]) / k
+    after = (cumulative[candidates + k] - cumulative[candidates]) / k
+    novelty = np.linalg.norm(after - before, axis=1)
+
+    starts = [0]
+    for i in np.argsort(-novelty, kind='stable'):
+        if novelty[i] <= novelty.mean():
+            break
+        bar = candidates[i]
+        if all(abs(bar - start) >= MIN_SECTION for start in starts):
+            starts.append(bar)
+    return sorted(starts)
+
+
+# Spotify style audio analysis of a WAV file
+def analyze(path):
+    started = time.perf_counter()
+    rate, duration, chunks = read(path)
+    loudness, flux, chroma, bands = frame_features(chunks, rate)
+    fps = rate / HOP
+    count = len(loudness)
+    power = 10 ** (loudness / 10)
+    overall = 10 * np.log10(power.mean() + TINY)
+
+    onset = onset_envelope(flux, fps)
+    spread = onset.std()
+    onsets = peaks(onset, max(1, int(MIN_SEGMENT * fps)),
+                   moving_average(onset, int(fps)) + ONSET_THRESHOLD * spread)
+
+    period, tempo_confidence = beat_period(onset, fps)
+    tempo = 60 * fps / period
+    beats = track_beats(onset, period)
+    if not len(beats):
+        beats = np.array([0])
+    beat_strength = np.minimum(1.0, onset[beats] / (np.percentile(
+        onset[beats], 90) + TINY))
+
+    # bars start on the beats of the phase that lands on the strongest beats
+    phase_scores = [beat_strength[phase::TIME_SIGNATURE].mean()
+                    if len(beat_strength[phase::TIME_SIGNATURE]) else 0
+                    for phase in range(TIME_SIGNATURE)]
+    downbeat = int(np.argmax(phase_scores))
+    signature_confidence = max(0.0, min(1.0, 1 - np.mean(phase_scores) /
+                                        (max(phase_scores) + TINY)) * 4)
+    bars = beats[downbeat::TIME_SIGNATURE]
+    tatum_times = np.sort(np.concatenate([
+        beats, (beats[:-1] + beats[1:]) / 2]))
+
+    # per bar loudness, chroma and band energies for the sections
+    bar_bounds = np.concatenate([[0], bars[bars > 0]])
+    bar_sizes = np.diff(np.append(bar_bounds, count))[:, None]
+    bar_features = np.hstack([
+        np.add.reduceat(loudness[:, None], bar_bounds) / bar_sizes,
+        np.add.reduceat(chroma / (chroma.max(axis=1, keepdims=True) + TINY),
+                        bar_bounds) / bar_sizes,
+        np.add.reduceat(bands, bar_bounds) / bar_sizes])
+    section_frames = bar_bounds[section_starts(bar_features)]
+    section_frames[0] = 0
+
+    sections = []
+    section_ends = np.append(section_frames[1:], count)
+    for start, end in zip(section_frames, section_ends):
+        key, key_confidence, mode, mode_confidence = key_of(
+            chroma[start:end].sum(axis=0))
+        inside = beats[(beats >= start) & (beats < end)]
+        local = 60 * fps / np.diff(inside).mean() if len(inside) > 2 \
+            else tempo
+        sections.append({
+            'start': rounded(start / fps),
+            'duration': rounded((end - start) / fps),
+            'confidence': 1.0 if start == 0 else rounded(
+                onset[start], 3),
+            'loudness': rounded(10 * np.log10(power[start:end].mean() + TINY),
+                                3),
+            'tempo': rounded(local, 3),
+            'tempo_confidence': rounded(tempo_confidence, 3),
+            'key': key,
+            'key_confidence': rounded(key_confidence, 3),
+            'mode': mode,
+            'mode_confidence': rounded(mode_confidence, 3),
+            'time_signature': TIME_SIGNATURE,
+            'time_signature_confidence': rounded(signature_confidence, 3),
+        })
+
+    key, key_confidence, mode, mode_confidence = key_of(chroma.sum(axis=0))
+    audible = np.flatnonzero(loudness > overall - 20)
+    track = {
+        'num_samples': int(round(duration * rate)),
+        'duration': rounded(duration),
+        'analysis_sample_rate': int(rate),
+        'analysis_channels': 1,
+        'end_of_fade_in': rounded(audible[0] / fps if len(audible) else 0),
+        'start_of_fade_out': rounded(audible[-1] / fps if len(audible)
+                                     else duration),
+        'loudness': rounded(overall, 3),
+        'tempo': rounded(tempo, 3),
+        'tempo_confidence': rounded(tempo_confidence, 3),
+        'time_signature': TIME_SIGNATURE,
+        'time_signature_confidence': rounded(signature_confidence, 3),
+        'key': key,
+        'key_confidence': rounded(key_confidence, 3),
+        'mode': mode,
+        'mode_confidence': rounded(mode_confidence, 3),
+    }
+
+    return {
+        'meta': {
+            'analyzer_version': 'local',
+            'platform': sys.platform,
+            'status_code': 0,
+            'status_message': 'OK',
+            'timestamp': int(time.time()),
+            'analysis_time': rounded(time.perf_counter() - started),
+            'input_process': 'wav',
+        },
+        'track': track,
+        'bars': spans(bars / fps, duration, beat_strength[downbeat::
+                                                          TIME_SIGNATURE]),
+        'beats': spans(beats / fps, duration, beat_strength),
+        'tatums': spans(tatum_times / fps, duration,
+                        np.repeat(beat_strength, 2)[:len(tatum_times)]),
+        'sections': sections,
+        'segments': segments_of(onsets, loudness, chroma, bands, onset, fps),
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: python analyzer.py song.wav [audio_analysis.json]')
+    analysis = analyze(sys.argv[1])
+    output = sys.argv[2] if len(sys.argv) > 2 else 'audio_analysis.json'
+    with open(output, 'w') as analysis_file:
+        json.dump(analysis, analysis_file)
+    print('Analyzed {:.1f}s of audio in {:.2f}s: {:.1f} bpm, {} beats, {} '
+          'sections, {} segments'.format(
+              analysis['track']['duration'], analysis['meta']['analysis_time'],
+              analysis['track']['tempo'], len(analysis['beats']),
+              len(analysis['sections']), len(analysis['segments'])))
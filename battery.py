@@ -0,0 +1,93 @@
+# battery and flight time budget of a compiled show
+# energy per drone is integrated straight from the keyframes of its track:
+# hover power plus a speed term over every leg, an acceleration term for every
+# change of velocity, and hover power from the last keyframe to the end of the
+# show for drones that are still up. the tracks are packed into padded arrays
+# once, after that a whole plan (or a stack of candidate plans) is a handful of
+# array ops, cheap enough to run inside a planner's search loop
+# the constants are rough figures for a Crazyflie 2.1 with the stock 250 mAh
+# battery, calibrate them against logged pm.vbat from real flights
+
+import numpy as np
+
+import show
+import spatial
+
+# 250 mAh at 3.7 V, in joules, and the share of it that is safe to use
+CAPACITY = 0.25 * 3.7 * 3600
+USABLE = 0.8
+# power drawn hovering and sitting on the ground with the radio on, in watts
+HOVER_POWER = 7.0
+IDLE_POWER = 0.3
+# extra watts per (m/s)^2 of speed and extra joules per m/s of velocity change
+SPEED_POWER = 0.5
+ACCELERATION_ENERGY = 0.4
+# share of the usable charge a drone should still have when the show ends
+RESERVE = 0.1
+
+
+# pads the keyframes of all tracks to the same length by repeating the last
+# one. returns times shape (n, k) and positions shape (n, k, 3)
+def pack(tracks):
+    length = max(len(track.times) for track in tracks)
+    times = np.empty((len(tracks), length))
+    positions = np.empty((len(tracks), length, 3))
+    for cf_id, track in enumerate(tracks):
+        k = len(track.times)
+        times[cf_id, :k] = track.times
+        times[cf_id, k:] = track.times[-1]
+        positions[cf_id, :k] = track.positions
+        positions[cf_id, k:] = track.positions[-1]
+    return np.nan_to_num(times), np.nan_to_num(positions)
+
+
+# joules used by every drone, shape (..., n). times shape (..., n, k) and
+# positions shape (..., n, k, 3) as from pack(), any leading dimensions are
+# separate plans. end is the end of the show, by default the last keyframe
+def energy(times, positions, end=None):
+    if end is None:
+        end = times.max(axis=(-2, -1), keepdims=True)[..., 0]
+
+    dt = np.diff(times, axis=-1)
+    step = np.diff(positions, axis=-2)
+    moving = dt > 0
+    velocity = np.where(moving[..., None],
+                        step / np.where(moving, dt, 1)[..., None], 0)
+    speed2 = (velocity ** 2).sum(axis=-1)
+
+    z = positions[..., 2]
+    airborne = (z[..., :-1] > spatial.GROUND) | (z[..., 1:] > spatial.GROUND)
+    power = np.where(airborne, HOVER_POWER + SPEED_POWER * speed2, IDLE_POWER)
+    used = (power * dt).sum(axis=-1)
+
+    # every change of velocity between two legs, the first leg starts at rest.
+    # legs without duration, the padding from pack() or a move cut short as
+    # it was sent, keep the velocity of the leg before them so they don't
+    # count as a stop
+    legs = np.arange(dt.shape[-1])
+    last = np.maximum.accumulate(np.where(moving, legs, 0), axis=-1)
+    velocity = np.take_along_axis(velocity, last[..., None], axis=-2)
+    change = np.diff(velocity, axis=-2, prepend=0)
+    used += ACCELERATION_ENERGY * (np.linalg.norm(change, axis=-1) *
+                                   airborne).sum(axis=-1)
+
+    # holding after the last keyframe until the show ends
+    tail = np.maximum(end - times[..., -1], 0)
+    up = z[..., -1] > spatial.GROUND
+    used += tail * np.where(up, HOVER_POWER, IDLE_POWER)
+    return used
+
+
+# share of the usable charge every drone has left at the end, shape (..., n)
+def remaining_charge(times, positions, end=None):
+    return 1 - energy(times, positions, end) / (CAPACITY * USABLE)
+
+
+def feasible(times, positions, end=None):
+    return (remaining_charge(times, positions, end) >= RESERVE).all(axis=-1)
+
+
+# remaining charge of every drone for a compiled sequence
+def estimate(sequence, n):
+    times, positions = pack(show.compile_tracks(sequence, n))
+    return remaining_charge(times, positions)
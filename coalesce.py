@@ -0,0 +1,106 @@
+# removes radio traffic that doesn't change what the drones fly
+# - a goto to where the drone already is, after its last move has finished,
+#   is dropped
+# - a goto that carries on in the same direction at about the same speed
+#   right as the previous goto ends is merged into it, giving one longer
+#   go_to instead of two moves with a stop in between
+# works on any time ordered stream of (time, cf_id, command) and yields one
+# again. a drone's last goto is held back until the next command for that
+# drone shows it can't be merged, everything else goes out as soon as nothing
+# earlier can still turn up, so the stream stays lazy. a lost drone gets no
+# next command, so lost() (e.g. a replan.Timeline's lost drones) is checked on
+# every move and their held back gotos are thrown away
+
+import heapq
+import itertools
+
+import numpy as np
+
+import show
+
+# distances and times closer than this are the same, in metres and seconds
+EPSILON = 1e-6
+# sine of the largest angle between two legs that still counts as collinear
+COLLINEAR = 0.01
+# largest relative difference in speed between legs that are merged
+SPEED_TOLERANCE = 0.1
+
+
+def new_stats():
+    return {'dropped': 0, 'merged': 0}
+
+
+def packets_saved(stats):
+    return stats['dropped'] + stats['merged']
+
+
+# whether leg (t2, d2) to b continues leg (t1, d1) from start to a
+def continues(start, t1, d1, a, t2, d2, b):
+    if start is None or abs(t2 - (t1 + d1)) > EPSILON or d1 <= 0 or d2 <= 0:
+        return False
+    u = np.subtract(a, start)
+    w = np.subtract(b, a)
+    lu, lw = np.linalg.norm(u), np.linalg.norm(w)
+    if lu < EPSILON or lw < EPSILON:
+        return False
+    if np.dot(u, w) <= 0 or np.linalg.norm(np.cross(u, w)) > COLLINEAR * lu * lw:
+        return False
+    return abs(lu / d1 - lw / d2) <= SPEED_TOLERANCE * max(lu / d1, lw / d2)
+
+
+def coalesce(moves, stats=None, lost=lambda: ()):
+    if stats is None:
+        stats = new_stats()
+    counter = itertools.count()
+    out = []
+    # cf_id -> [time, cf_id, command, start position] of the held back goto
+    pending = {}
+    # cf_id -> (target, arrival) of the drone's latest move, None if unknown
+    last = {}
+
+    def release(cf_id):
+        t, _, command, _ = pending.pop(cf_id)
+        heapq.heappush(out, (t, next(counter), (t, cf_id, command)))
+
+    for t, cf_id, command in moves:
+        for gone in lost():
+            pending.pop(gone, None)
+        previous = last.get(cf_id)
+        if type(command).__name__ == 'Goto':
+            target = tuple(command[:3])
+            held = pending.get(cf_id)
+            settled = previous is not None and t >= previous[1] - EPSILON
+            if settled and np.allclose(previous[0], target, atol=EPSILON):
+                stats['dropped'] += 1
+            elif held is not None and continues(held[3], held[0],
+                                                held[2].time, held[2][:3],
+                                                t, command.time, target):
+                held[2] = command._replace(time=held[2].time + command.time)
+                last[cf_id] = (target, held[0] + held[2].time)
+                stats['merged'] += 1
+            else:
+                if held is not None:
+                    release(cf_id)
+                start = previous[0] if settled else None
+                pending[cf_id] = [t, cf_id, command, start]
+                last[cf_id] = (target, t + command.time)
+        else:
+            if cf_id in pending:
+                release(cf_id)
+            heapq.heappush(out, (t, next(counter), (t, cf_id, command)))
+            here = previous[0] if previous is not None else None
+            target = show.target_of(command, here) if here is not None else None
+            if target is not None:
+                last[cf_id] = (target, t + command.time)
+            elif type(command).__name__ in ('Takeoff', 'Land'):
+                last[cf_id] = None
+
+        # nothing that comes later can be earlier than this
+        horizon = min([t] + [held[0] for held in pending.values()])
+        while out and out[0][0] <= horizon:
+            yield heapq.heappop(out)[2]
+
+    for cf_id in list(pending):
+        release(cf_id)
+    while out:
+        yield heapq.heappop(out)[2]
@@ -1,8 +1,22 @@
 # driver for the Crazyflie choreo
 # uses the spotipy client and primitives script to generate choreo
 
+import battery
+import coalesce
+import geofence
+import instrumentation
+import journal
+import lights
+import pipeline
 import primitives
-
+import radio
+import replan
+import spatial
+import trajectory
+
+import heapq
+import os
+import sys
 import threading
 import time
 import json
@@ -11,39 +25,50 @@ from queue import Queue
 
 import cflib.crtp
 from cflib.crazyflie.log import LogConfig
+from cflib.crazyflie.mem import MemoryElement
+from cflib.crazyflie.mem import Poly4D
 from cflib.crazyflie.swarm import CachedCfFactory
 from cflib.crazyflie.swarm import Swarm
 from cflib.crazyflie.syncLogger import SyncLogger
 
 # Time for one step in second
 STEP_TIME = 1
-
-# Possible commands, all times are in seconds
-Takeoff = namedtuple('Takeoff', ['height', 'time'])
-Land = namedtuple('Land', ['time'])
-Goto = namedtuple('Goto', ['x', 'y', 'z', 'time'])
-# Note: removed for now, since we don't have LEDs
-# Ring = namedtuple('Ring', ['r', 'g', 'b', 'intensity', 'time'])
-# RGB [0-255], Intensity [0.0-1.0]
+# moves due within this long of a scheduler tick go out on that tick, so
+# commands are sent within half a tick of their time
+LOOKAHEAD = radio.TICK_TIME / 2
+# print every step and command, slows the control loop down
+VERBOSE = False
+# every flown show is journaled here, see journal.py
+JOURNAL_DIRECTORY = 'journals'
+# fly the LED ring light track from lights.py, set with --lights
+LIGHTS = False
+# fly every section as splines through its waypoints instead of stop-and-go
+# gotos, see trajectory.py. set with --smooth
+SMOOTH = False
+# trajectory memory slot the splines are uploaded to
+TRAJECTORY_ID = 1
+
+# Possible commands, all times are in seconds. shared with primitives.py so
+# the commands in the generated sequence are the ones checked for below
+from primitives import Takeoff, Land, Goto, Ring, Spline, Upload
 
 # Reserved for the control loop, do not use in sequence
 Quit = namedtuple('Quit', [])
 
-uris = [
-    'radio://0/10/2M/E7E7E7E701',  # cf_id 0
-    'radio://0/10/2M/E7E7E7E702',  # cf_id 1
-    'radio://0/10/2M/E7E7E7E703',  # cf_id 3
-    'radio://0/10/2M/E7E7E7E704',  # cf_id 4
-    'radio://0/10/2M/E7E7E7E705',  # cf_id 5
-    'radio://0/10/2M/E7E7E7E706',  # cf_id 6
-    'radio://0/10/2M/E7E7E7E707',  # cf_id 7
-    'radio://0/10/2M/E7E7E7E708',  # cf_id 8
-    'radio://0/10/2M/E7E7E7E709',  # cf_id 9
-]
+# one uri per drone, sharded over the radio links configured in radio.LINKS
+uris = radio.make_uris(primitives.NUM_DRONES)
 
 # populated in generate_sequence
 sequence = []
 
+# journal of the show being flown, set up by control_thread
+journal_writer = None
+
+# the replan.Timeline being flown, drones lost mid show are dropped from it
+timeline = None
+# cf_ids lost since the control thread last looked
+dropped = Queue()
+
 def wait_for_position_estimator(scf):
     print('Waiting for estimator to find position...')
 
@@ -117,17 +142,39 @@ def set_ring_color(cf, r, g, b, intensity, time):
     cf.param.set_value('ring.fadeColor', str(color))
 
 
+# writes spline pieces to the drone's trajectory memory and defines them as
+# TRAJECTORY_ID, blocks until the upload is done
+def upload_trajectory(cf, pieces):
+    trajectory_mem = cf.mem.get_mems(MemoryElement.TYPE_TRAJ)[0]
+    trajectory_mem.poly4Ds = [
+        Poly4D(duration, Poly4D.Poly(x), Poly4D.Poly(y), Poly4D.Poly(z),
+               Poly4D.Poly([0.0] * trajectory.POLY4D_COEFFS))
+        for duration, x, y, z in pieces]
+
+    uploaded = threading.Event()
+    trajectory_mem.write_data(lambda mem, addr: uploaded.set())
+    uploaded.wait()
+    cf.high_level_commander.define_trajectory(TRAJECTORY_ID, 0, len(pieces))
+
+
 def crazyflie_control(scf):
     cf = scf.cf
-    control = controlQueues[uris.index(cf.link_uri)]
+    cf_id = uris.index(cf.link_uri)
+    control = controlQueues[cf_id]
+    go_to_time = ('go_to', cf_id)
 
     activate_mellinger_controller(scf, True)
+    cf.connection_lost.add_callback(
+        lambda link_uri, message: drop_drone(cf_id))
 
     commander = scf.cf.high_level_commander
+    # pieces in the drone's trajectory memory
+    uploaded = None
 
     # Set fade to color effect and reset to Led-ring OFF
-    # set_ring_color(cf, 0, 0, 0, 0, 0)
-    # cf.param.set_value('ring.effect', '14')
+    if LIGHTS:
+        set_ring_color(cf, 0, 0, 0, 0, 0)
+        cf.param.set_value('ring.effect', '14')
 
     while True:
         command = control.get()
@@ -138,7 +185,19 @@ def crazyflie_control(scf):
         elif type(command) is Land:
             commander.land(0.0, command.time)
         elif type(command) is Goto:
+            started = time.perf_counter()
             commander.go_to(command.x, command.y, command.z, 0, command.time)
+            instrumentation.record(go_to_time, time.perf_counter() - started)
+        elif type(command) is Upload:
+            upload_trajectory(cf, command.pieces)
+            uploaded = command.pieces
+        elif type(command) is Spline:
+            # a drone that took over a lost drone's slot mid section never
+            # got the upload
+            if command.pieces is not uploaded:
+                upload_trajectory(cf, command.pieces)
+                uploaded = command.pieces
+            commander.start_trajectory(TRAJECTORY_ID, 1.0, False)
         elif type(command) is Ring:
             set_ring_color(cf, command.r, command.g, command.b,
                            command.intensity, command.time)
@@ -147,67 +206,167 @@ def crazyflie_control(scf):
             print('Warning! unknown command {} for uri {}'.format(command,
                                                                   cf.uri))
 
-def control_thread():
-    pointer = 0
+def send_command(cf_id, command):
+    controlQueues[cf_id].put(command)
+    if journal_writer is not None:
+        journal_writer.record(cf_id, command)
+    instrumentation.record(('queue_depth', cf_id), controlQueues[cf_id].qsize(),
+                           instrumentation.DEPTH_BOUNDS)
+
+
+# called when a drone is lost mid show. the remaining drones take over the
+# slots that matter most from the next move on, see replan.py
+def drop_drone(cf_id):
+    print('Lost cf_id {}, flying the rest of the show without it'.format(
+        cf_id))
+    if timeline is not None:
+        timeline.drop(cf_id)
+    dropped.put(cf_id)
+    controlQueues[cf_id].put(Quit())
+
+
+# dispatches moves, a time ordered iterable of (time, cf_id, command) such as
+# the generated sequence or a pipeline stream. moves are pulled from it on
+# every scheduler tick, once they are due within LOOKAHEAD
+def control_thread(moves):
+    global journal_writer
+    moves = iter(moves)
+    move = next(moves, None)
     step = 0
-    stop = False
+    stop = move is None
+    lost = set()
+    scheduler = radio.LinkScheduler(uris, send_command)
+    ticks = int(STEP_TIME / radio.TICK_TIME)
+    start = time.monotonic()
 
-    while not stop:
-        print('Step {}:'.format(step))
-        while sequence[pointer][0] <= step:
-            cf_id = sequence[pointer][1]
-            command = sequence[pointer][2]
-
-            print(' - Running: {} on {}'.format(command, cf_id))
-            controlQueues[cf_id].put(command)
-            pointer += 1
-
-            if pointer >= len(sequence):
-                print('Reaching the end of the sequence, stopping!')
-                stop = True
-                break
+    os.makedirs(JOURNAL_DIRECTORY, exist_ok=True)
+    journal_writer = journal.JournalWriter(os.path.join(
+        JOURNAL_DIRECTORY, time.strftime('show_%Y%m%d_%H%M%S.cfj')), start)
 
+    while not stop:
+        if VERBOSE:
+            print('Step {}:'.format(step))
+
+        # spread the step over scheduler ticks so every link only gets its
+        # packet budget per tick. ticks sleep until their slot on the show
+        # clock, so slow ticks don't push the rest of the show back
+        for tick in range(ticks):
+            while not dropped.empty():
+                cf_id = dropped.get()
+                lost.add(cf_id)
+                scheduler.discard(cf_id)
+
+            now = time.monotonic() - start
+            while move is not None and move[0] <= now + LOOKAHEAD:
+                deadline, cf_id, command = move
+                if VERBOSE:
+                    print(' - Running: {} on {}'.format(command, cf_id))
+                if cf_id not in lost:
+                    scheduler.submit(cf_id, command, deadline)
+                move = next(moves, None)
+
+            scheduler.tick(now)
+            slot = step * STEP_TIME + (tick + 1) * radio.TICK_TIME
+            time.sleep(max(0, start + slot - time.monotonic()))
+
+        if move is None:
+            print('Reaching the end of the sequence, stopping!')
+            stop = True
+
+        overrun = time.monotonic() - start - (step + 1) * STEP_TIME
+        if overrun > radio.TICK_TIME:
+            instrumentation.count('step_overruns')
+            instrumentation.record('step_overrun', overrun)
         step += 1
-        time.sleep(STEP_TIME)
+
+    while any(scheduler.backlog().values()):
+        scheduler.tick(time.monotonic() - start)
+        time.sleep(radio.TICK_TIME)
+    scheduler.report()
+    if instrumentation.ENABLED:
+        instrumentation.report()
+
+    journal_writer.close()
+    print('Journaled {} commands to {} ({} lost)'.format(
+        journal_writer.written, journal_writer.path, journal_writer.lost))
+    journal_writer = None
 
     for ctrl in controlQueues:
         ctrl.put(Quit())
 
 
-def add_primitive(step, start, duration):
-    # TODO: add logic for selecting primitives based off audio analysis
-    primitive = primitives.kickline
-    basic_duration = primitive[-1][0]
-    incr = primitive[0][0] * (duration / basic_duration)
-    for movement in primitive:
-        # TODO: add clause to make sure crazyflie isn't moving faster
-        # than its max speed
-        if (movement[0] * duration) / basic_duration > incr:
-            incr = movement[0] * (duration / basic_duration)
-        goto = (movement[2][0], movement[2][1], movement[2][2], movement[2][3] * (duration / basic_duration))
-        move = (step + incr, movement[1], goto)
-        sequence.append(move)
-    step += incr
-    return step
-
-# uses "Section" information in the audio analysis to transition primitives
-def generate_sequence(analysis):
-    sections = analysis['sections']
-    step = 0
-    for section in sections:
-        step = add_primitive(step, section['start'], section['duration'])
+def generate_sequence(plans, expand=pipeline.expand):
+    stats = coalesce.new_stats()
+    moves = replan.Timeline(plans, len(uris), expand)
+    sequence.extend(coalesce.coalesce(moves, stats))
     for move in sequence:
         print(move)
         print('\n')
+    print('Coalescing saved {} packets ({} no-op moves dropped, {} legs '
+          'merged)'.format(coalesce.packets_saved(stats), stats['dropped'],
+                           stats['merged']))
+
+
+# separation, flight envelope and battery checks of the generated sequence,
+# returns True if the show is safe to fly
+def validate_sequence():
+    ok = True
+    violations = spatial.check_sequence(sequence, len(uris))
+    if violations:
+        print('Warning! {} separation violations, first: {}'.format(
+            len(violations), violations[0]))
+        ok = False
+    violations = geofence.check_sequence(sequence, len(uris))
+    if violations:
+        print('Warning! {} flight envelope violations, first: {}'.format(
+            len(violations), violations[0]))
+        ok = False
+    charge = battery.estimate(sequence, len(uris))
+    if charge.min() < battery.RESERVE:
+        print('Warning! cf_id {} is predicted to end the show with {:.0%} of '
+              'its battery'.format(charge.argmin(), charge.min()))
+        ok = False
+    return ok
 
 
 if __name__ == '__main__':
+    # dispatch statistics are printed after the show, they can also be
+    # switched on and off while it runs with instrumentation.enable()/disable()
+    if '--stats' in sys.argv:
+        instrumentation.enable()
+    LIGHTS = '--lights' in sys.argv
+    SMOOTH = '--smooth' in sys.argv
+
     # read in audio_analysis
     analysis_file = open('audio_analysis.json', 'r')
     analysis = json.load(analysis_file)
 
-    # TODO: no collision avoidance in this sequence generation
-    generate_sequence(analysis)
+    # the show is always flown from a timeline so lost drones can be dropped
+    # from it. without drops it gives exactly the validated sequence
+    plans = list(pipeline.plan(analysis))
+    expand = pipeline.expand_smooth if SMOOTH else pipeline.expand
+    timeline = replan.Timeline(plans, len(uris), expand)
+    moves = coalesce.coalesce(timeline, lost=lambda: timeline.lost)
+
+    # with --stream the show starts right away and every section is expanded
+    # just before it is flown. the whole show checks need the full sequence,
+    # so they are skipped
+    if '--stream' in sys.argv:
+        print('Streaming the show, skipping separation, envelope and battery '
+              'checks')
+    else:
+        # TODO: no collision avoidance in this sequence generation, only a
+        # check, and a replanned timeline isn't checked at all
+        generate_sequence(plans, expand)
+        if not validate_sequence():
+            sys.exit('Not flying a show that fails validation')
+
+    # the light track only goes out after the motion commands of the same
+    # tick, see radio.PRIORITY
+    if LIGHTS:
+        light_track = lights.track(analysis, len(uris), uris)
+        print('Light track: {} ring commands'.format(len(light_track)))
+        moves = heapq.merge(moves, light_track, key=lambda move: move[0])
 
     controlQueues = [Queue() for _ in range(len(uris))]
 
@@ -222,7 +381,7 @@ if __name__ == '__main__':
 
     #    print('Starting sequence!')
 
-    #    threading.Thread(target=control_thread).start()
+    #    threading.Thread(target=control_thread, args=(moves,)).start()
 
     #    swarm.parallel_safe(crazyflie_control)
 
@@ -0,0 +1,238 @@
+# headless Spotify fetcher, fills the local analysis store without a browser
+# takes a playlist and/or track ids, uris or links, and pulls every track's
+# audio analysis and audio features from the Web API using the client
+# credentials flow. requests go out from a thread pool over one pooled
+# requests session. a 429 pauses every worker for the Retry-After the server
+# asks for, server errors and dropped connections are retried with
+# exponential backoff and jitter. the results are written straight into
+# STORE_DIRECTORY as <track id>.json (the audio_analysis driver.py reads) and
+# <track id>.features.json. api_url and token_url can point at a local
+# stand-in server for testing. run as
+#   python fetch.py [--playlist <playlist>] [<track> ...]
+# with SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET set
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = 'https://api.spotify.com/v1'
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+STORE_DIRECTORY = 'analyses'
+
+# requests in flight at once, and connections kept open for them
+WORKERS = 8
+# seconds before a request is given up on
+TIMEOUT = 10
+# retries of one request, the first waits BACKOFF seconds and every next
+# one twice as long, up to MAX_BACKOFF
+RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+RETRY_STATUS = (500, 502, 503, 504)
+# wait after a 429 without a Retry-After header, seconds
+DEFAULT_RETRY_AFTER = 1
+# most ids the audio features endpoint takes at once, and playlist page size
+FEATURES_BATCH = 100
+PAGE = 100
+# refresh the access token this long before it expires, seconds
+TOKEN_MARGIN = 60
+
+
+# 'spotify:track:ID', 'https://open.spotify.com/track/ID?si=..' or 'ID' -> ID
+def spotify_id(reference):
+    return reference.split('?')[0].rstrip('/').replace(':', '/').split('/')[-1]
+
+
+def store_path(track_id, kind='analysis', directory=STORE_DIRECTORY):
+    suffix = '.json' if kind == 'analysis' else '.{}.json'.format(kind)
+    return os.path.join(directory, track_id + suffix)
+
+
+# written to a temporary file first so readers never see half a file
+def save(track_id, data, kind='analysis', directory=STORE_DIRECTORY):
+    path = store_path(track_id, kind, directory)
+    partial = '{}.{}.part'.format(path, threading.get_ident())
+    with open(partial, 'w') as store_file:
+        json.dump(data, store_file)
+    os.replace(partial, path)
+    return path
+
+
+def load(track_id, kind='analysis', directory=STORE_DIRECTORY):
+    with open(store_path(track_id, kind, directory), 'r') as store_file:
+        return json.load(store_file)
+
+
+class SpotifyFetcher:
+
+    def __init__(self, client_id, client_secret, api_url=API_URL,
+                 token_url=TOKEN_URL, workers=WORKERS):
+        self.credentials = (client_id, client_secret)
+        self.api_url = api_url.rstrip('/')
+        self.token_url = token_url
+        self.workers = workers
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires = 0
+        # time.monotonic() every worker waits for after a 429
+        self.paused_until = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def access_token(self):
+        with self.lock:
+            if self.token is None or time.monotonic() >= self.expires:
+                response = self.session.post(
+                    self.token_url, data={'grant_type': 'client_credentials'},
+                    auth=self.credentials, timeout=TIMEOUT)
+                response.raise_for_status()
+                token = response.json()
+                self.token = token['access_token']
+                self.expires = time.monotonic() + \
+                    token.get('expires_in', 3600) - TOKEN_MARGIN
+            return self.token
+
+    # json body of a GET on the api, path is relative to api_url or a full
+    # url such as a playlist page's 'next'
+    def get(self, path, params=None):
+        url = path if '://' in path else self.api_url + path
+        delay = BACKOFF
+        for attempt in range(RETRIES + 1):
+            wait = self.paused_until - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if attempt:
+                self.retries += 1
+
+            try:
+                response = self.session.get(
+                    url, params=params, timeout=TIMEOUT,
+                    headers={'Authorization': 'Bearer ' + self.access_token()})
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == RETRIES:
+                    raise
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, MAX_BACKOFF)
+                continue
+
+            if response.status_code == 429:
+                self.rate_limited += 1
+                retry_after = float(response.headers.get('Retry-After',
+                                                         DEFAULT_RETRY_AFTER))
+                with self.lock:
+                    self.paused_until = max(self.paused_until,
+                                            time.monotonic() + retry_after)
+            elif response.status_code == 401:
+                # token expired early, get a new one
+                with self.lock:
+                    self.token = None
+            elif response.status_code in RETRY_STATUS:
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, MAX_BACKOFF)
+            else:
+                response.raise_for_status()
+                return response.json()
+        raise RuntimeError('Gave up on {} after {} retries ({})'.format(
+            url, RETRIES, response.status_code))
+
+    # ids of every track on a playlist, following the pages
+    def playlist_tracks(self, playlist):
+        ids = []
+        page = self.get('/playlists/{}/tracks'.format(spotify_id(playlist)),
+                        {'fields': 'items(track(id)),next', 'limit': PAGE})
+        while True:
+            ids.extend(item['track']['id'] for item in page['items']
+                       if item.get('track') and item['track'].get('id'))
+            if not page.get('next'):
+                return ids
+            page = self.get(page['next'])
+
+    def analysis(self, track_id):
+        return self.get('/audio-analysis/{}'.format(track_id))
+
+    # audio features of up to FEATURES_BATCH tracks, None for unknown ones
+    def features(self, track_ids):
+        return self.get('/audio-features',
+                        {'ids': ','.join(track_ids)})['audio_features']
+
+    # fetches and stores the analysis and features of every track, skipping
+    # tracks already in the store unless refresh is set. returns
+    # {track id: error} of the tracks that failed
+    def fetch(self, tracks, directory=STORE_DIRECTORY, refresh=False):
+        os.makedirs(directory, exist_ok=True)
+        ids = list(dict.fromkeys(spotify_id(track) for track in tracks))
+        if not refresh:
+            ids = [track_id for track_id in ids if not
+                   (os.path.exists(store_path(track_id, 'analysis', directory))
+                    and os.path.exists(store_path(track_id, 'features',
+                                                  directory)))]
+        failed = {}
+
+        def fetch_analysis(track_id):
+            try:
+                save(track_id, self.analysis(track_id), 'analysis', directory)
+            except Exception as error:
+                failed[track_id] = error
+
+        def fetch_features(batch):
+            try:
+                for track_id, features in zip(batch, self.features(batch)):
+                    if features is None:
+                        failed[track_id] = LookupError('no audio features')
+                    else:
+                        save(track_id, features, 'features', directory)
+            except Exception as error:
+                failed.update((track_id, error) for track_id in batch)
+
+        batches = [ids[i:i + FEATURES_BATCH]
+                   for i in range(0, len(ids), FEATURES_BATCH)]
+        with ThreadPoolExecutor(self.workers) as pool:
+            jobs = [pool.submit(fetch_features, batch) for batch in batches]
+            jobs += [pool.submit(fetch_analysis, track_id)
+                     for track_id in ids]
+            for job in jobs:
+                job.result()
+        return failed
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    playlists = []
+    while '--playlist' in arguments:
+        at = arguments.index('--playlist')
+        playlists.append(arguments[at + 1])
+        del arguments[at:at + 2]
+
+    client_id = os.environ.get('SPOTIPY_CLIENT_ID')
+    client_secret = os.environ.get('SPOTIPY_CLIENT_SECRET')
+    if not client_id or not client_secret:
+        sys.exit('Set SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET')
+    fetcher = SpotifyFetcher(client_id, client_secret,
+                             os.environ.get('SPOTIFY_API_URL', API_URL),
+                             os.environ.get('SPOTIFY_TOKEN_URL', TOKEN_URL))
+
+    tracks = list(arguments)
+    for playlist in playlists:
+        tracks.extend(fetcher.playlist_tracks(playlist))
+
+    started = time.perf_counter()
+    failed = fetcher.fetch(tracks)
+    print('Fetched {} tracks into {} in {:.1f}s ({} retries, {} rate '
+          'limited)'.format(len(tracks) - len(failed), STORE_DIRECTORY,
+                            time.perf_counter() - started, fetcher.retries,
+                            fetcher.rate_limited))
+    for track_id, error in failed.items():
+        print('Warning! {} failed: {}'.format(track_id, error))
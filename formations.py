@@ -0,0 +1,196 @@
+# vectorized formation generators for any number of crazyflies
+# every generator returns (times, positions, active):
+#   times     - shape (steps,), start of each step in seconds
+#   positions - shape (steps, n, 3), goto target of every drone at every step
+#   active    - shape (steps, n), False where a drone gets no command that step
+# the whole formation is computed in one array op per axis, so the same
+# primitive works for 9, 20 or 50 drones. the geometry given is what 9 drones
+# fly; when more drones would come closer than SPACING the formation grows
+# (a longer line, then more rows, wider or taller rings) as far as the flight
+# envelope allows, and a formation that still doesn't fit raises ValueError.
+# primitives.py turns the arrays into (time, cf_id, Goto) tuples
+
+import numpy as np
+
+import geofence
+import spatial
+
+# positions are rounded to the millimetre, well below what the LPS resolves
+DECIMALS = 3
+# closest two drones may be at a step or halfway through a move
+SPACING = spatial.MIN_SEPARATION
+# room formations can grow into, (min, max) per axis in metres
+LIMITS = geofence.BOX
+# slack for rounding when comparing distances, metres
+TOLERANCE = 1e-6
+# formations grow to spacing plus this, so rounding positions to DECIMALS
+# can't bring two drones under spacing
+MARGIN = 10 ** -DECIMALS
+
+
+# smallest distance between two drones at any step or halfway between two
+def min_distance(positions):
+    frames = np.concatenate([positions, (positions[1:] + positions[:-1]) / 2])
+    distance = np.linalg.norm(frames[:, :, None] - frames[:, None, :], axis=3)
+    distance[:, np.arange(distance.shape[1]), np.arange(distance.shape[1])] = \
+        np.inf
+    return distance.min() if distance.size else np.inf
+
+
+def check_spacing(name, positions, spacing):
+    closest = min_distance(positions)
+    if closest < spacing - TOLERANCE:
+        raise ValueError('{} drones don\'t fit in a {} with {} m between them '
+                         '(closest {:.3f} m)'.format(positions.shape[1], name,
+                                                     spacing, closest))
+
+
+def line(n, x_min=-1.5, x_max=1.5, y=0, z=0, spacing=SPACING, limits=LIMITS):
+    # n drones evenly spaced along the x axis, shape (n, 3). if they would be
+    # closer than spacing the line is stretched about its middle up to the x
+    # limits, then split into rows spacing apart in y
+    (x_low, x_high), (y_low, y_high) = limits[0], limits[1]
+    spacing += MARGIN
+    per_row = int((x_high - x_low) / spacing + TOLERANCE) + 1
+    rows = -(-n // per_row) if n > 1 and \
+        (x_max - x_min) / (n - 1) < spacing - TOLERANCE else 1
+    per_row = -(-n // rows)
+
+    if per_row > 1 and (x_max - x_min) / (per_row - 1) < spacing - TOLERANCE:
+        middle = (x_min + x_max) / 2
+        half = (per_row - 1) * spacing / 2
+        middle = min(max(middle, x_low + half), x_high - half)
+        x_min, x_max = middle - half, middle + half
+    row_y = y + (np.arange(rows) - (rows - 1) / 2) * spacing
+    if row_y[0] < y_low - TOLERANCE or row_y[-1] > y_high + TOLERANCE:
+        raise ValueError('{} drones don\'t fit in lines {} m apart'.format(
+            n, spacing))
+
+    pos = np.empty((n, 3))
+    pos[:, 0] = np.tile(np.linspace(x_min, x_max, per_row), rows)[:n]
+    pos[:, 1] = np.repeat(row_y, per_row)[:n]
+    pos[:, 2] = z
+    return pos
+
+
+def kickline(n, x_min=-1.5, x_max=1.5, z_base=1, z_low=0.75, kicks=6,
+             step_time=1, spacing=SPACING):
+    # line up at z_base, alternate drones dip to z_low for each kick, then
+    # line back up at z_base
+    steps = kicks + 2
+    k = np.arange(steps)[:, None]
+    i = np.arange(n)[None, :]
+
+    low = ((i + k) % 2 == 1) & (k >= 1) & (k <= kicks)
+
+    positions = np.broadcast_to(line(n, x_min, x_max, spacing=spacing),
+                                (steps, n, 3)).copy()
+    positions[:, :, 2] = np.where(low, z_low, z_base)
+    check_spacing('kickline', positions, spacing)
+
+    times = np.arange(steps) * step_time
+    return times, positions.round(DECIMALS), np.ones((steps, n), dtype=bool)
+
+
+def wave(n, x_min=-1.5, x_max=1.5, z_bot=0.5, z_top=1.5, period=None,
+         steps=8, step_time=1, spacing=SPACING):
+    # drones in a line trace a sine of `period` drones (defaults to the whole
+    # line) that travels one drone per step. drone 0 starts halfway up the
+    # crest, as in the original hand-written table
+    if period is None:
+        period = n
+    k = np.arange(steps)[:, None]
+    i = np.arange(n)[None, :]
+
+    z_mid = (z_top + z_bot) / 2
+    amplitude = (z_top - z_bot) / 2
+    phase = 2 * np.pi * (i + k) / period + np.pi / 6
+
+    positions = np.broadcast_to(line(n, x_min, x_max, spacing=spacing),
+                                (steps, n, 3)).copy()
+    positions[:, :, 2] = z_mid + amplitude * np.sin(phase)
+    check_spacing('wave', positions, spacing)
+
+    times = np.arange(steps) * step_time
+    return times, positions.round(DECIMALS), np.ones((steps, n), dtype=bool)
+
+
+# (ring_size, half_width, z, crown_z) that keeps the layers of a ring stack
+# spacing apart and its drones spacing apart even halfway through a move.
+# rings take more slots when the layers don't fit between the heights given,
+# the top layer (and a crown above it) moves up and the rings widen as far as
+# the limits allow
+def fit_rings(m, half_width, z, crown_z, ring_size, spacing, limits):
+    reach = min(-limits[0][0], limits[0][1], -limits[1][0], limits[1][1])
+    spacing += MARGIN
+    for size in range(ring_size, m + 1 if m > ring_size else ring_size + 1):
+        layers = -(-m // size)
+        bottom, top = z
+        if layers > 1 and (top - bottom) / (layers - 1) < spacing - TOLERANCE:
+            top = bottom + (layers - 1) * spacing
+        if top > limits[2][1] - (spacing if crown_z >= z[1] else 0):
+            continue
+
+        # drones halfway between two slots are sin(2 pi / size) * radius apart
+        half = np.array(half_width, dtype=float)
+        needed = spacing * np.cos(np.pi / size) / np.sin(2 * np.pi / size)
+        half *= max(1.0, needed / half.min())
+        if half.max() / np.cos(np.pi / size) > reach:
+            continue
+
+        crown = crown_z + top - z[1] if crown_z >= z[1] else crown_z
+        return size, tuple(half), (bottom, top), crown
+    raise ValueError('{} drones don\'t fit in rings {} m apart'.format(
+        m + 1, spacing))
+
+
+def rotating_rings(n, half_width, z, crown_z, start_angle, ring_size=4,
+                   steps=4, step_time=2.5, spacing=SPACING, limits=LIMITS):
+    # every drone but the last sits in a stack of rings with ring_size slots,
+    # filled bottom up. half_width and z are (bottom, top) pairs, the layers in
+    # between are interpolated. half_width is measured from the centre to the
+    # middle of a ring side, so a 4 slot ring with half_width w has its
+    # corners at (+-w, +-w). each step every ring drone moves one slot
+    # clockwise. the last drone is the crown: it holds (0, 0, crown_z) and is
+    # only commanded on the first step. see fit_rings for how the rings grow
+    # with more drones
+    m = n - 1
+    ring_size, half_width, z, crown_z = fit_rings(
+        m, half_width, z, crown_z, ring_size, spacing, limits)
+    layers = -(-m // ring_size)
+    layer = np.arange(m) // ring_size
+    slot = np.arange(m) % ring_size
+
+    radius = np.linspace(half_width[0], half_width[1], layers) / np.cos(np.pi / ring_size)
+    height = np.linspace(z[0], z[1], layers)
+
+    k = np.arange(steps)[:, None]
+    angle = start_angle - 2 * np.pi * (slot[None, :] + k) / ring_size
+
+    positions = np.zeros((steps, n, 3))
+    positions[:, :m, 0] = radius[layer] * np.cos(angle)
+    positions[:, :m, 1] = radius[layer] * np.sin(angle)
+    positions[:, :m, 2] = height[layer]
+    positions[:, m, 2] = crown_z
+
+    active = np.ones((steps, n), dtype=bool)
+    active[1:, m] = False
+    check_spacing('ring stack', positions, spacing)
+
+    # adding 0.0 turns the -0.0 that rounding leaves on the axes into 0.0
+    times = np.arange(steps) * step_time
+    return times, positions.round(DECIMALS) + 0.0, active
+
+
+def rotating_tower(n, x_base=0.8, x_mid=0.4, z_base=0.5, z_mid=1, z_top=1.5,
+                   steps=4, step_time=2.5):
+    # rings shrink towards the top, crowned by one drone above the centre
+    return rotating_rings(n, (x_base, x_mid), (z_base, z_mid), z_top,
+                          -np.pi / 4, steps=steps, step_time=step_time)
+
+
+def rotating_cube(n, x_in=0.4, z_out=0.5, z_mid=1.5, z_in=1, steps=4,
+                  step_time=2.5):
+    # equal rings from z_out to z_mid with one drone hovering at the centre
+    return rotating_rings(n, (x_in, x_in), (z_out, z_mid), z_in, np.pi / 4,
+                          steps=steps, step_time=step_time)
@@ -0,0 +1,82 @@
+# flight envelope checks for a compiled sequence
+# every sampled position of every drone is checked against the box spanned by
+# the LPS anchors, an optional floor plan polygon and a minimum altitude in
+# one array pass. the minimum altitude applies while a drone flies a goto or
+# hovers, takeoffs and landings have to pass through it and drones sitting on
+# the ground are fine
+
+from collections import namedtuple
+
+import numpy as np
+
+import show
+import spatial
+
+# box the drones have to stay in, (min, max) per axis in metres. set it to
+# the volume covered by the LPS anchors
+BOX = ((-2, 2), (-2, 2), (0, 2.5))
+# optional (x, y) corners of the floor plan for rooms that aren't a box,
+# e.g. [(-2, -2), (2, -2), (2, 1), (0, 2), (-2, 2)]
+POLYGON = None
+# lowest a drone may fly a goto, in metres
+MIN_ALTITUDE = 0.3
+
+Envelope = namedtuple('Envelope', ['box', 'polygon', 'min_altitude'])
+ENVELOPE = Envelope(BOX, POLYGON, MIN_ALTITUDE)
+
+# what is wrong: 'x_min', 'x_max', ... 'z_max', 'polygon' or 'floor'
+Violation = namedtuple('Violation', ['time', 'cf_id', 'limit', 'position'])
+
+AXES = 'xyz'
+
+
+# True for points (..., 2) inside the polygon, by ray casting one edge at a
+# time over all points at once
+def inside_polygon(points, polygon):
+    x, y = points[..., 0], points[..., 1]
+    corners = np.asarray(polygon, dtype=float)
+    inside = np.zeros(x.shape, dtype=bool)
+    for (x0, y0), (x1, y1) in zip(corners, np.roll(corners, -1, axis=0)):
+        crosses = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (x < at)
+    return inside
+
+
+# violation masks of sampled positions shape (len(times), n, 3), as a dict of
+# limit -> (len(times), n) bool array. moves are the show.MOVES codes from
+# show.sample_moves, without them the floor applies everywhere
+def check_positions(positions, moves=None, envelope=ENVELOPE):
+    valid = ~np.isnan(positions).any(axis=2)
+    masks = {}
+    for axis, (low, high) in enumerate(envelope.box):
+        masks[AXES[axis] + '_min'] = valid & (positions[:, :, axis] < low)
+        masks[AXES[axis] + '_max'] = valid & (positions[:, :, axis] > high)
+    if envelope.polygon is not None:
+        masks['polygon'] = valid & ~inside_polygon(positions, envelope.polygon)
+    z = positions[:, :, 2]
+    flying = valid
+    if moves is not None:
+        flying = valid & ((moves == show.GOTO) |
+                          (moves == show.HOLD) & (z >= spatial.GROUND))
+    masks['floor'] = flying & (z < envelope.min_altitude)
+    return masks
+
+
+# every sample of a sequence outside the envelope, ordered by time
+def check_sequence(sequence, n, envelope=ENVELOPE, dt=show.SAMPLE_TIME):
+    tracks = show.compile_tracks(sequence, n)
+    times = np.arange(0, show.end_time(tracks) + dt, dt)
+    positions = show.sample(tracks, times)
+    masks = check_positions(positions, show.sample_moves(tracks, times),
+                            envelope)
+
+    violations = []
+    for limit, mask in masks.items():
+        step, cf_id = mask.nonzero()
+        violations.extend(zip(times[step].tolist(), cf_id.tolist(),
+                              [limit] * len(step),
+                              map(tuple, positions[step, cf_id].tolist())))
+    violations.sort()
+    return [Violation(*violation) for violation in violations]
@@ -0,0 +1,102 @@
+# low overhead counters and histograms for the dispatch hot path
+# recording is a dict lookup, a bisect and an integer add, nothing is
+# formatted until summary()/report() is called after (or during) the show.
+# everything is off until enable() is called and can be switched at runtime.
+# names are plain strings or tuples like ('go_to', cf_id) so callers never
+# build strings on the hot path
+
+from bisect import bisect_left
+
+ENABLED = False
+
+# bucket upper bounds for durations in seconds, 4 per decade from 10us to 10s
+TIME_BOUNDS = [10 ** (e / 4) for e in range(-20, 5)]
+# bucket upper bounds for queue depths
+DEPTH_BOUNDS = [0, 1, 2, 4, 8, 16, 32, 64, 128]
+
+histograms = {}
+counters = {}
+
+
+class Histogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # the last bucket catches everything above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # upper bound of the bucket holding the q-th quantile, the largest value
+    # recorded if it is above the last bound
+    def quantile(self, q):
+        wanted = q * self.total
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.total,
+            'mean': self.sum / self.total if self.total else None,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    histograms.clear()
+    counters.clear()
+
+
+def record(name, value, bounds=TIME_BOUNDS):
+    if not ENABLED:
+        return
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = Histogram(bounds)
+    histogram.record(value)
+
+
+def count(name, n=1):
+    if ENABLED:
+        counters[name] = counters.get(name, 0) + n
+
+
+# snapshot of everything recorded so far, safe to call while the show runs
+def summary():
+    stats = {name: histogram.summary()
+             for name, histogram in list(histograms.items())}
+    stats.update(list(counters.items()))
+    return stats
+
+
+def report():
+    for name, stats in sorted(summary().items(), key=lambda item: str(item[0])):
+        if isinstance(stats, dict):
+            print('{}: {count} samples, mean {mean}, p50 <= {p50}, '
+                  'p99 <= {p99}, max {max}'.format(name, **stats))
+        else:
+            print('{}: {}'.format(name, stats))
@@ -0,0 +1,140 @@
+# append-only binary journal of every dispatched command
+# the dispatcher calls record() on its hot path; that only stamps the command
+# with the monotonic show time and hands it to a bounded queue. a background
+# thread packs and writes the records in batches. if the writer falls behind
+# and the queue fills up, records are counted as lost rather than holding up
+# the dispatch. read() turns a journal back into (time, cf_id, command) and
+# replay() feeds it through a simulated swarm, as fast as possible or at a
+# chosen speed up, for post-mortems
+#
+# file layout: MAGIC, then one RECORD per command: show time (double),
+# cf_id (uint16), opcode (uint8) and ARGS float32 arguments, zero padded.
+# a Spline's or Upload's record holds its number of pieces and is followed by
+# one PIECE per piece: duration and the x, y and z coefficients as float32
+
+import struct
+import threading
+import time
+from queue import Queue, Full, Empty
+
+import trajectory
+from primitives import Takeoff, Land, Goto, Ring, Spline, Upload
+
+MAGIC = b'CFJ1'
+ARGS = 5
+RECORD = struct.Struct('<dHB{}f'.format(ARGS))
+PIECE = struct.Struct('<{}f'.format(1 + 3 * trajectory.POLY4D_COEFFS))
+
+# opcode of every command that can be journaled, new commands go at the end
+# so older journals still read
+COMMANDS = [Takeoff, Land, Goto, Ring, Spline, Upload]
+OPCODES = {command.__name__: opcode for opcode, command in enumerate(COMMANDS)}
+
+# records buffered between the dispatcher and the writer thread
+BUFFER = 4096
+# most records packed into one write
+BATCH = 256
+
+
+class JournalWriter:
+
+    # start is the time.monotonic() the show started at, defaults to now
+    def __init__(self, path, start=None, buffer=BUFFER):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.queue = Queue(maxsize=buffer)
+        self.lost = 0
+        self.written = 0
+        self.start = time.monotonic() if start is None else start
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # called on the dispatch path, never blocks
+    def record(self, cf_id, command):
+        try:
+            self.queue.put_nowait((time.monotonic() - self.start, cf_id,
+                                   command))
+        except Full:
+            self.lost += 1
+
+    def run(self):
+        while True:
+            entries = [self.queue.get()]
+            try:
+                while len(entries) < BATCH:
+                    entries.append(self.queue.get_nowait())
+            except Empty:
+                pass
+
+            closing = entries[-1] is None
+            if closing:
+                entries.pop()
+            self.file.write(b''.join(pack(*entry) for entry in entries))
+            self.written += len(entries)
+            if closing:
+                self.file.close()
+                return
+
+    # writes out everything recorded so far and closes the file
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def pack(at, cf_id, command):
+    pieces = b''
+    if 'pieces' in command._fields:
+        pieces = b''.join(PIECE.pack(duration, *x, *y, *z)
+                          for duration, x, y, z in command.pieces)
+        command = command._replace(pieces=len(command.pieces))
+    args = list(command) + [0.0] * (ARGS - len(command))
+    return RECORD.pack(at, cf_id, OPCODES[type(command).__name__],
+                       *args) + pieces
+
+
+# the pieces following a Spline's or Upload's record, None if the journal ends first
+def read_pieces(journal, count):
+    raw = journal.read(PIECE.size * count)
+    if len(raw) < PIECE.size * count:
+        return None
+    coeffs = trajectory.POLY4D_COEFFS
+    pieces = []
+    for values in PIECE.iter_unpack(raw):
+        pieces.append((values[0],) + tuple(
+            list(values[1 + axis * coeffs:1 + (axis + 1) * coeffs])
+            for axis in range(3)))
+    return pieces
+
+
+# every (time, cf_id, command) in a journal, in the order it was recorded
+def read(path):
+    with open(path, 'rb') as journal:
+        if journal.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a command journal'.format(path))
+        while True:
+            raw = journal.read(RECORD.size)
+            if len(raw) < RECORD.size:
+                return
+            at, cf_id, opcode, *args = RECORD.unpack(raw)
+            command = COMMANDS[opcode]
+            command = command(*args[:len(command._fields)])
+            if 'pieces' in command._fields:
+                pieces = read_pieces(journal, int(command.pieces))
+                if pieces is None:
+                    return
+                command = command._replace(pieces=pieces)
+            yield at, cf_id, command
+
+
+# feeds a journal into a simulator.SimulatedSwarm, stamped with the recorded
+# times. with speed set the replay is paced at that many times real time,
+# otherwise it runs as fast as possible. returns the swarm
+def replay(path, swarm, speed=None):
+    started = time.monotonic()
+    for at, cf_id, command in read(path):
+        if speed is not None:
+            time.sleep(max(0, started + at / speed - time.monotonic()))
+        swarm.now = at
+        swarm.send(cf_id, command, at)
+    return swarm
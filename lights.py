@@ -0,0 +1,109 @@
+# LED ring light track from the music
+# the colour of every segment comes from its pitches and loudness in one pass
+# over the segment arrays: the hue is the circular mean of the pitch classes
+# round the colour wheel (C red, an octave once round), the saturation how
+# much the strongest pitches stand out and the intensity the segment's peak
+# loudness. neighbouring drones are shifted a little round the wheel.
+# a colour change costs radio.PACKETS['Ring'] packets on every drone, so
+# changes are thinned to LIGHT_SHARE of each link's packet budget: the song is
+# cut into windows just long enough for one change on every drone of the
+# busiest link and each window keeps the segment furthest from the colour
+# last kept, if it is far enough to be seen. the light track is a
+# time ordered stream of (time, cf_id, Ring) that driver.py merges with the
+# motion moves; radio.PRIORITY sends rings after every motion command, so
+# lights never hold up a move
+
+import numpy as np
+
+import radio
+import timing
+from primitives import Ring
+
+# share of every link's packet budget the lights may use
+LIGHT_SHARE = 0.2
+# peak loudness mapped onto intensity MIN_INTENSITY..1, dB
+LOUDNESS_RANGE = (-40.0, 0.0)
+MIN_INTENSITY = 0.1
+# how strongly a clear pitch saturates the colour
+SATURATION_GAIN = 3.0
+# hue difference between neighbouring drones, in turns of the wheel
+HUE_SPREAD = 1 / 36
+# longest fade into a new colour, seconds
+FADE_TIME = 0.2
+# smallest change of the scaled colour that is worth sending, RGB units
+MIN_CHANGE = 10.0
+
+
+# (hue, saturation, intensity) of every segment, each shape (segments,)
+def segment_colours(analysis):
+    lookup = timing.index_of(analysis)
+    pitches = lookup.field('segments', 'pitches')
+    loudness = lookup.field('segments', 'loudness_max')
+
+    wheel = np.exp(2j * np.pi * np.arange(12) / 12)
+    mean = pitches @ wheel / (pitches.sum(axis=1) + 1e-9)
+    hue = np.angle(mean) / (2 * np.pi) % 1
+    saturation = np.clip(np.abs(mean) * SATURATION_GAIN, 0, 1)
+
+    low, high = LOUDNESS_RANGE
+    level = np.clip((loudness - low) / (high - low), 0, 1)
+    intensity = MIN_INTENSITY + (1 - MIN_INTENSITY) * level
+    return hue, saturation, intensity
+
+
+# RGB [0-255] of hues and saturations at full value, shape (..., 3)
+def to_rgb(hue, saturation):
+    channel = np.abs((hue[..., None] * 6 + np.array([0, 4, 2])) % 6 - 3) - 1
+    channel = np.clip(channel, 0, 1)
+    saturation = saturation[..., None]
+    return (1 - saturation + saturation * channel) * 255
+
+
+# seconds between colour changes that keeps every link within its share
+def change_interval(uris, share=LIGHT_SHARE):
+    drones = max(np.unique([radio.link_of(uri) for uri in uris],
+                           return_counts=True)[1])
+    packets = drones * radio.PACKETS.get('Ring', 1)
+    return packets / (radio.PACKETS_PER_SECOND * share)
+
+
+# indices of the changes kept, at most one in every interval long window:
+# going through the windows in order, the segment whose colour is furthest
+# from the last colour kept, if it is at least MIN_CHANGE away. the first is
+# always kept
+def thin(times, colours, interval):
+    window = np.floor(times / interval).astype(np.int64)
+    bounds = np.append(np.flatnonzero(np.diff(window)) + 1, len(times))
+    keep = [0]
+    for first, stop in zip(bounds[:-1], bounds[1:]):
+        change = np.linalg.norm(colours[first:stop] - colours[keep[-1]],
+                                axis=1)
+        best = np.argmax(change)
+        if change[best] >= MIN_CHANGE:
+            keep.append(first + best)
+    return np.array(keep)
+
+
+# time ordered (time, cf_id, Ring) light track for n drones on the given uris
+def track(analysis, n, uris, share=LIGHT_SHARE):
+    lookup = timing.index_of(analysis)
+    times = lookup.starts['segments']
+    if not len(times):
+        return []
+    hue, saturation, intensity = segment_colours(analysis)
+
+    keep = thin(times, to_rgb(hue, saturation) * intensity[:, None],
+                change_interval(uris, share))
+    times, hue = times[keep], hue[keep]
+    saturation, intensity = saturation[keep], intensity[keep]
+    fades = np.minimum(np.diff(times, append=np.inf), FADE_TIME)
+
+    # shape (changes, n, 3)
+    drone_hue = (hue[:, None] + np.arange(n) * HUE_SPREAD) % 1
+    rgb = np.rint(to_rgb(drone_hue, np.repeat(saturation[:, None], n, axis=1)))
+    rgb = rgb.astype(np.int64).tolist()
+
+    return [(t, cf_id, Ring(*rgb[i][cf_id], level, fade))
+            for i, (t, level, fade) in enumerate(zip(
+                times.tolist(), intensity.round(3).tolist(), fades.tolist()))
+            for cf_id in range(n)]
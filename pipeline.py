@@ -0,0 +1,225 @@
+# lazy choreography pipeline
+# sections are planned up front (which primitive, when, for how long), but a
+# section's moves are only expanded when the show gets to it. the per-section
+# streams are merged in time order by a k-way merge that opens a stream once
+# the merged output reaches its start, so only the sections in flight are held
+# in memory however long the show is. the driver either collects everything
+# into `sequence` to validate it first, or dispatches straight from the stream
+#
+# primitive steps are put on the song's beats rather than stretched evenly
+# over the section: every section gets a grid of the beats its steps land on,
+# a whole number of beats per step starting on the first downbeat, and step
+# times are warped piecewise linearly onto it, so moves follow tempo changes
+#
+# sections that repeat earlier music (see similarity.py) don't expand their
+# primitive again: the section they repeat is expanded once into a Block when
+# it is planned, and the repeats retime its moves onto their own beat grid
+
+import heapq
+import itertools
+import math
+from collections import namedtuple
+
+import numpy as np
+
+import primitives
+import similarity
+import timing
+import trajectory
+
+# one section of the show: the step it starts on, the primitive flown, the
+# duration it is stretched to and the beat grid it is warped onto, see
+# beat_grid. without a grid the primitive is stretched linearly. block is
+# the Block of the earlier section it repeats, if any
+Plan = namedtuple('Plan', ['step', 'primitive', 'duration', 'grid', 'block'],
+                  defaults=(None, None))
+
+# the expanded moves of a section, with the step, duration and beat grid it
+# was expanded for
+Block = namedtuple('Block', ['step', 'moves', 'duration', 'grid'])
+
+
+def choose_primitive(section):
+    # TODO: add logic for selecting primitives based off audio analysis
+    return primitives.kickline
+
+
+# how far a primitive stretched to duration advances the step
+def advance(primitive, duration):
+    scale = duration / primitive[-1][0]
+    return max(t for t, _, _ in primitive) * scale
+
+
+# fewest beats per step that put every step of a primitive on a beat, e.g. 2
+# for steps at 2.5 and 7.5. primitives that need more than most are left to
+# fall between beats
+def step_quantum(primitive, most=16):
+    times = np.array([t for t, _, _ in primitive], dtype=float)
+    for beats in range(1, most + 1):
+        if np.allclose(times * beats, np.round(times * beats)):
+            return beats
+    return 1
+
+
+# (beats per step, beat times) for a primitive flown over the section from
+# step for duration, or None if the section has too few beats to put every
+# step of the primitive on one. the grid starts on the first beat of the
+# section, or the first downbeat if one comes within a bar, and step t of
+# the primitive lands on grid[t * beats per step], which is a multiple of
+# step_quantum. primitives ending on a fractional step get a grid up to the
+# next whole step
+def beat_grid(beats, downbeats, step, duration, primitive, per_bar=4):
+    steps = math.ceil(primitive[-1][0])
+    quantum = step_quantum(primitive)
+    first, end = np.searchsorted(beats, [step, step + duration])
+    downbeat = np.searchsorted(downbeats, step)
+    if downbeat < len(downbeats):
+        on_bar = np.searchsorted(beats, downbeats[downbeat])
+        if on_bar - first < per_bar and on_bar < end:
+            first = on_bar
+    if steps <= 0 or end - first < steps * quantum:
+        return None
+    per_step = int((end - first) // (steps * quantum)) * quantum
+
+    grid = beats[first:first + steps * per_step + 1]
+    missing = steps * per_step + 1 - len(grid)
+    if missing:
+        period = grid[-1] - grid[-2] if len(grid) > 1 else duration / steps
+        grid = np.append(grid, grid[-1] + period * np.arange(1, missing + 1))
+    return per_step, grid
+
+
+# uses "Section" information in the audio analysis to transition primitives.
+# sections that repeat earlier music fly the same primitive as that section,
+# retimed from its Block
+def plan(analysis):
+    repeats = similarity.section_repeats(analysis)
+    repeated = set(source for source in repeats if source is not None)
+    lookup = timing.index_of(analysis)
+    beats, downbeats = lookup.starts['beats'], lookup.starts['bars']
+    per_bar = analysis.get('track', {}).get('time_signature', 4)
+    chosen = []
+    blocks = {}
+    step = 0
+    for index, (section, source) in enumerate(zip(analysis['sections'],
+                                                  repeats)):
+        if source is None:
+            primitive = choose_primitive(section)
+        else:
+            primitive = chosen[source][0]
+        grid = beat_grid(beats, downbeats, step, section['duration'],
+                         primitive, per_bar)
+        chosen.append((primitive, grid))
+        if index in repeated:
+            blocks[index] = Block(step, list(expand(
+                step, primitive, section['duration'], grid)),
+                section['duration'], grid)
+        yield Plan(step, primitive, section['duration'], grid,
+                   blocks.get(source))
+        step += advance(primitive, section['duration'])
+
+
+# times of fractional grid positions, piecewise linear between the beats and
+# carried on at the last beat period past the end of the grid
+def warp(positions, beats):
+    times = np.interp(positions, np.arange(len(beats)), beats)
+    if len(beats) > 1:
+        past = np.maximum(positions - (len(beats) - 1), 0)
+        times += past * (beats[-1] - beats[-2])
+    return times
+
+
+# grid positions of times, the inverse of warp
+def unwarp(times, beats):
+    positions = np.interp(times, beats, np.arange(len(beats)))
+    if len(beats) > 1:
+        positions += np.maximum(times - beats[-1], 0) / (beats[-1] -
+                                                         beats[-2])
+    return positions
+
+
+# the moves of a Block retimed to a section. the start and end of every move
+# keep their place on the beat grid when both have one, otherwise they are
+# stretched linearly
+def retime(block, step, duration, grid=None):
+    starts = np.array([t for t, _, _ in block.moves], dtype=float)
+    ends = starts + np.array([command.time for _, _, command in block.moves])
+    if grid is None or block.grid is None:
+        scale = duration / block.duration
+        starts = step + (starts - block.step) * scale
+        ends = step + (ends - block.step) * scale
+    else:
+        (source_per_step, source_beats), (per_step, beats) = block.grid, grid
+        scale = per_step / source_per_step
+        starts = warp(unwarp(starts, source_beats) * scale, beats)
+        ends = warp(unwarp(ends, source_beats) * scale, beats)
+    for (_, cf_id, command), start, end in zip(block.moves, starts.tolist(),
+                                               (ends - starts).tolist()):
+        yield (start, cf_id, command._replace(time=max(0.0, end)))
+
+
+# the moves of a primitive over a section, in time order. with a beat grid
+# the start and end of every move are warped onto it, otherwise the
+# primitive is stretched linearly. sections repeating a block retime it
+def expand(step, primitive, duration, grid=None, block=None):
+    if block is not None:
+        yield from retime(block, step, duration, grid)
+        return
+    if grid is None:
+        scale = duration / primitive[-1][0]
+        incr = primitive[0][0] * scale
+        for t, cf_id, command in primitive:
+            # TODO: add clause to make sure crazyflie isn't moving faster
+            # than its max speed
+            if t * scale > incr:
+                incr = t * scale
+            yield (step + incr, cf_id,
+                   command._replace(time=command.time * scale))
+        return
+
+    per_step, beats = grid
+    t = np.array([t for t, _, _ in primitive], dtype=float)
+    length = np.array([command.time for _, _, command in primitive])
+    starts = np.maximum.accumulate(warp(t * per_step, beats))
+    ends = warp((t + length) * per_step, beats)
+    for (_, cf_id, command), start, end in zip(primitive, starts.tolist(),
+                                               (ends - starts).tolist()):
+        yield (start, cf_id, command._replace(time=max(0.0, end)))
+
+
+# expand with every section's gotos flown as splines, see trajectory.smooth
+def expand_smooth(step, primitive, duration, grid=None, block=None,
+                  n=primitives.NUM_DRONES):
+    return trajectory.smooth(expand(step, primitive, duration, grid, block),
+                             n)
+
+
+# k-way time ordered merge of (start, moves) streams given in start order,
+# where every stream is time ordered and starts no earlier than `start`.
+# streams are only opened once everything before their start has been
+# yielded, moves at the same time come out in stream order
+def merge(streams):
+    heap = []
+    counter = itertools.count()
+    streams = iter(streams)
+    upcoming = next(streams, None)
+    while heap or upcoming is not None:
+        while upcoming is not None and (not heap or upcoming[0] <= heap[0][0]):
+            _, stream = upcoming
+            move = next(stream, None)
+            if move is not None:
+                heapq.heappush(heap, (move[0], next(counter), move, stream))
+            upcoming = next(streams, None)
+        if not heap:
+            continue
+        _, order, move, stream = heapq.heappop(heap)
+        yield move
+        following = next(stream, None)
+        if following is not None:
+            heapq.heappush(heap, (following[0], order, following, stream))
+
+
+# every move of the show in time order, generated as it is pulled
+def moves(analysis):
+    return merge((section.step, expand(*section))
+                 for section in plan(analysis))
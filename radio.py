@@ -0,0 +1,209 @@
+# radio links for the swarm
+# drones are sharded over several Crazyradios/channels from LINKS, and the
+# LinkScheduler budgets how many packets each link gets per tick so one busy
+# link doesn't hold up the others. every drone's commands go out in the order
+# they were sequenced (by deadline, then submission), the high level
+# commander flies the newest one. PRIORITY only decides which drone's next
+# command goes first. SimulatedLink stands in for the radios when testing
+# without hardware
+
+import heapq
+import itertools
+
+import instrumentation
+
+# (dongle, channel) of every radio link, drones are split evenly between them
+# in cf_id order. the channel has to match the one flashed into the drones
+# on that link, e.g. [(0, 10), (1, 40), (2, 70)] for three dongles
+LINKS = [(0, 10)]
+DATARATE = '2M'
+# address of cf_id 0, the others count up from it
+BASE_ADDRESS = 0xE7E7E7E701
+
+# packets a 2M link reliably gets through per second, and the scheduler tick
+PACKETS_PER_SECOND = 500
+TICK_TIME = 0.01
+
+# lower goes first between the next commands of different drones.
+# takeoff/land/quit can't wait, uploads have until their spline starts and
+# light changes can wait longest
+PRIORITY = {
+    'Quit': 0,
+    'Takeoff': 0,
+    'Land': 0,
+    'Goto': 1,
+    'Spline': 1,
+    'Upload': 2,
+    'Ring': 3,
+}
+# packets a command takes, one unless listed. a ring fade is two param writes,
+# an upload about what writing a section's pieces to trajectory memory and
+# defining them takes. commands bigger than a tick's budget use up the
+# budget of the ticks after them too
+PACKETS = {
+    'Ring': 2,
+    'Upload': 32,
+}
+
+
+def make_uris(n, links=LINKS, datarate=DATARATE, base_address=BASE_ADDRESS):
+    per_link = -(-n // len(links))
+    uris = []
+    for cf_id in range(n):
+        dongle, channel = links[cf_id // per_link]
+        uris.append('radio://{}/{}/{}/{:X}'.format(
+            dongle, channel, datarate, base_address + cf_id))
+    return uris
+
+
+# 'radio://0/10/2M/E7E7E7E701' -> 'radio://0/10/2M'
+def link_of(uri):
+    return uri.rsplit('/', 1)[0]
+
+
+class LinkScheduler:
+    # send(cf_id, command) does the actual dispatch, e.g. putting the command
+    # on the drone's control queue
+
+    def __init__(self, uris, send, packets_per_tick=None):
+        if packets_per_tick is None:
+            packets_per_tick = max(1, int(PACKETS_PER_SECOND * TICK_TIME))
+        self.send = send
+        self.packets_per_tick = packets_per_tick
+        self.links = [link_of(uri) for uri in uris]
+        # per link a heap of every drone's next command, per drone a heap of
+        # its commands by (deadline, submission). heads holds the counter of
+        # the entry that is current for every drone with commands waiting,
+        # other entries on the link heap are stale and skipped
+        self.pending = {link: [] for link in self.links}
+        self.queues = [[] for _ in uris]
+        self.heads = {}
+        self.counter = itertools.count()
+
+        self.ticks = 0
+        self.sent = {link: 0 for link in self.pending}
+        # packets of the last command sent still to be paid from the budget
+        self.owed = {link: 0 for link in self.pending}
+        self.max_lateness = {link: 0 for link in self.pending}
+        self.lateness_names = {link: ('lateness', link)
+                               for link in self.pending}
+
+    def submit(self, cf_id, command, deadline):
+        queue = self.queues[cf_id]
+        order = next(self.counter)
+        heapq.heappush(queue, (deadline, order, command))
+        if queue[0][1] == order:
+            self.push_head(cf_id)
+
+    # puts the drone's next command on its link's heap
+    def push_head(self, cf_id):
+        queue = self.queues[cf_id]
+        if not queue:
+            self.heads.pop(cf_id, None)
+            return
+        deadline, order, command = queue[0]
+        priority = PRIORITY.get(type(command).__name__, 1)
+        self.heads[cf_id] = order
+        heapq.heappush(self.pending[self.links[cf_id]],
+                       (priority, deadline, order, cf_id, command))
+
+    # dispatches up to packets_per_tick packets worth of commands on every
+    # link, whatever doesn't fit waits for the next tick. returns the number
+    # of packets sent
+    def tick(self, now):
+        self.ticks += 1
+        total = 0
+        for link, queue in self.pending.items():
+            lateness_name = self.lateness_names[link]
+            paid = min(self.owed[link], self.packets_per_tick)
+            self.owed[link] -= paid
+            budget = self.packets_per_tick - paid
+            while queue and budget:
+                _, _, order, cf_id, command = queue[0]
+                if self.heads.get(cf_id) != order:
+                    heapq.heappop(queue)
+                    continue
+                cost = PACKETS.get(type(command).__name__, 1)
+                if cost > budget and budget < self.packets_per_tick:
+                    break
+                _, deadline, _, cf_id, command = heapq.heappop(queue)
+                heapq.heappop(self.queues[cf_id])
+                self.push_head(cf_id)
+                self.send(cf_id, command)
+                lateness = now - deadline
+                self.max_lateness[link] = max(self.max_lateness[link],
+                                              lateness)
+                instrumentation.record(lateness_name, max(0, lateness))
+                self.owed[link] = max(0, cost - budget)
+                budget -= min(cost, budget)
+            sent = self.packets_per_tick - budget
+            self.sent[link] += sent
+            total += sent
+        return total
+
+    # drops every command still waiting for cf_id, e.g. once it is lost.
+    # returns the number dropped
+    def discard(self, cf_id):
+        dropped = len(self.queues[cf_id])
+        self.queues[cf_id] = []
+        self.heads.pop(cf_id, None)
+        return dropped
+
+    def backlog(self):
+        backlog = {link: 0 for link in self.pending}
+        for link, queue in zip(self.links, self.queues):
+            backlog[link] += len(queue)
+        return backlog
+
+    # share of each link's packet budget used so far
+    def utilization(self):
+        capacity = max(1, self.ticks * self.packets_per_tick)
+        return {link: sent / capacity for link, sent in self.sent.items()}
+
+    def report(self):
+        utilization = self.utilization()
+        backlog = self.backlog()
+        for link in sorted(self.pending):
+            print('{}: {} packets, {:.1%} of budget, {} pending, '
+                  'max {:.3f}s late'.format(link, self.sent[link],
+                                            utilization[link], backlog[link],
+                                            self.max_lateness[link]))
+
+
+class SimulatedLink:
+    # records what would have gone over the air instead of sending it.
+    # packets holds (tick, link, cf_id, command), tick is advanced by whoever
+    # drives the scheduler
+
+    def __init__(self, uris):
+        self.links = [link_of(uri) for uri in uris]
+        self.packets = []
+        self.tick = 0
+
+    def send(self, cf_id, command):
+        self.packets.append((self.tick, self.links[cf_id], cf_id, command))
+
+    def packets_per_tick(self, link):
+        counts = {}
+        for tick, packet_link, _, _ in self.packets:
+            if packet_link == link:
+                counts[tick] = counts.get(tick, 0) + 1
+        return counts
+
+
+# pushes a time ordered sequence of (time, cf_id, command) through a
+# scheduler over a SimulatedLink, without sleeping. returns the scheduler
+# and the link so utilization and packet timing can be checked
+def simulate(sequence, uris, packets_per_tick=None, tick_time=TICK_TIME):
+    link = SimulatedLink(uris)
+    scheduler = LinkScheduler(uris, link.send, packets_per_tick)
+    pointer = 0
+    while pointer < len(sequence) or any(scheduler.backlog().values()):
+        now = link.tick * tick_time
+        while pointer < len(sequence) and sequence[pointer][0] <= now:
+            deadline, cf_id, command = sequence[pointer]
+            scheduler.submit(cf_id, command, deadline)
+            pointer += 1
+        scheduler.tick(now)
+        link.tick += 1
+    return scheduler, link
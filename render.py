@@ -0,0 +1,181 @@
+# offline previews of a compiled sequence
+# every drone's position is sampled from the compiled tracks (show.py) and
+# rasterized straight into numpy image arrays, whole views or batches of
+# animation frames at a time, and written as PNG with zlib. no per-frame or
+# per-command python loops, so a five minute show previews in seconds and
+# candidate plans can be rendered side by side in a process pool
+
+import os
+import struct
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+
+import show
+
+# area drawn, in metres: (x_min, x_max), (y_min, y_max), (z_min, z_max)
+BOUNDS = ((-2, 2), (-2, 2), (0, 2.5))
+# axes drawn by each view
+VIEWS = {
+    'top': (0, 1),
+    'side': (0, 2),
+}
+SIZE = 400
+# sampling of the tracks for still images and frame rate for animations
+PATH_SAMPLE_TIME = 0.02
+FPS = 10
+# seconds of trail drawn behind every drone in animation frames
+TRAIL = 1.0
+FRAME_BATCH = 100
+# pixel offsets of the dot drawn at a drone's current position
+MARKER = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)]
+
+BACKGROUND = (16, 16, 16)
+GRID = (48, 48, 48)
+
+
+# one evenly spaced hue per drone, shape (n, 3) uint8
+def palette(n):
+    hue = np.arange(n) / max(n, 1) * 6
+    channel = np.abs((hue[:, None] + np.array([0, 4, 2])) % 6 - 3) - 1
+    return (np.clip(channel, 0, 1) * 215 + 40).astype(np.uint8)
+
+
+def blank(size=SIZE, view='top', bounds=BOUNDS, frames=None):
+    shape = (size, size, 3) if frames is None else (frames, size, size, 3)
+    image = np.empty(shape, dtype=np.uint8)
+    image[...] = BACKGROUND
+    # a line every metre
+    for axis, pixel_axis in zip(VIEWS[view], (-2, -3)):
+        low, high = bounds[axis]
+        metres = np.arange(np.ceil(low), np.floor(high) + 1)
+        pixels = _to_pixels(metres, low, high, size, flip=pixel_axis == -3)
+        index = [slice(None)] * image.ndim
+        index[pixel_axis] = pixels
+        image[tuple(index)] = GRID
+    return image
+
+
+def _to_pixels(values, low, high, size, flip=False):
+    pixels = np.round((values - low) / (high - low) * (size - 1))
+    if flip:
+        pixels = size - 1 - pixels
+    return pixels.astype(np.int64)
+
+
+# pixel coordinates of positions shape (..., 3) in a view, plus a mask of the
+# ones inside the drawn area
+def project(positions, view='top', size=SIZE, bounds=BOUNDS):
+    a, b = VIEWS[view]
+    (a_low, a_high), (b_low, b_high) = bounds[a], bounds[b]
+    u, v = positions[..., a], positions[..., b]
+    inside = (u >= a_low) & (u <= a_high) & (v >= b_low) & (v <= b_high)
+    u = np.where(inside, u, a_low)
+    v = np.where(inside, v, b_low)
+    return (_to_pixels(v, b_low, b_high, size, flip=True),
+            _to_pixels(u, a_low, a_high, size), inside)
+
+
+# every drone's whole path in one image
+def draw_paths(positions, view='top', size=SIZE, bounds=BOUNDS):
+    steps, n, _ = positions.shape
+    image = blank(size, view, bounds)
+    rows, cols, inside = project(positions, view, size, bounds)
+    colours = np.broadcast_to(palette(n), (steps, n, 3))
+    image[rows[inside], cols[inside]] = colours[inside]
+    return image
+
+
+# animation frames from start_frame on, shape (frames, size, size, 3). every
+# frame shows where the drones were over the last TRAIL seconds
+def draw_frames(times, positions, start_frame, frames, view='top', size=SIZE,
+                bounds=BOUNDS, fps=FPS, trail=TRAIL):
+    steps, n, _ = positions.shape
+    images = blank(size, view, bounds, frames)
+    rows, cols, inside = project(positions, view, size, bounds)
+    colours = np.broadcast_to(palette(n), (steps, n, 3))
+
+    # a sample at time t shows up in the frames from t to t + trail. samples
+    # are taken every 1/fps, rounding keeps float noise from pushing one into
+    # the next frame
+    first = np.round(times * fps).astype(np.int64) - start_frame
+    span = int(np.ceil(trail * fps))
+    frame = first[:, None] + np.arange(span)[None, :]
+    keep = (frame >= 0) & (frame < frames)
+    step, offset = keep.nonzero()
+
+    frame = np.repeat(frame[step, offset][:, None], n, axis=1)
+    visible = inside[step]
+    images[frame[visible], rows[step][visible], cols[step][visible]] = \
+        colours[step][visible]
+
+    # a bigger dot where every drone is at the frame's own time
+    now = offset == 0
+    visible = visible[now]
+    frame = frame[now][visible]
+    rows, cols = rows[step[now]][visible], cols[step[now]][visible]
+    colours = colours[step[now]][visible]
+    for dr, dc in MARKER:
+        images[frame, np.clip(rows + dr, 0, size - 1),
+               np.clip(cols + dc, 0, size - 1)] = colours
+    return images
+
+
+def write_png(path, image):
+    height, width, _ = image.shape
+    # every row starts with filter type 0
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    with open(path, 'wb') as png:
+        png.write(b'\x89PNG\r\n\x1a\n')
+        png.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2,
+                                             0, 0, 0)))
+        png.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 1)))
+        png.write(chunk(b'IEND', b''))
+
+
+# top and side views of a sequence as <prefix>_top.png and <prefix>_side.png
+def preview(sequence, n, prefix, size=SIZE):
+    _, positions = show.sample_show(sequence, n, PATH_SAMPLE_TIME)
+    paths = []
+    for view in VIEWS:
+        path = '{}_{}.png'.format(prefix, view)
+        write_png(path, draw_paths(positions, view, size))
+        paths.append(path)
+    return paths
+
+
+# animation frames of a sequence as <directory>/<view>_00000.png, ...
+# rendered FRAME_BATCH frames at a time to keep memory bounded
+def animate(sequence, n, directory, view='top', size=SIZE, fps=FPS):
+    os.makedirs(directory, exist_ok=True)
+    times, positions = show.sample_show(sequence, n, 1 / fps)
+    total = len(times)
+    for start_frame in range(0, total, FRAME_BATCH):
+        frames = min(FRAME_BATCH, total - start_frame)
+        images = draw_frames(times, positions, start_frame, frames, view,
+                             size, fps=fps)
+        for i, image in enumerate(images):
+            write_png(os.path.join(directory, '{}_{:05d}.png'.format(
+                view, start_frame + i)), image)
+    return total
+
+
+def _preview_job(job):
+    return preview(*job)
+
+
+# previews of many candidate sequences at once, written as
+# <directory>/plan_<i>_top.png etc.
+def preview_many(sequences, n, directory, processes=None):
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(sequence, n, os.path.join(directory, 'plan_{}'.format(i)))
+            for i, sequence in enumerate(sequences)]
+    with Pool(processes) as pool:
+        return pool.map(_preview_job, jobs)
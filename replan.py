@@ -0,0 +1,192 @@
+# keeps the show going when drones drop out
+# every primitive's slots (the cf_ids it was written for) are ranked by how
+# much the formation needs them: slots that never get a goto come last,
+# otherwise the closer a slot flies to the middle of the formation the more
+# it matters, so lines lose their ends and towers their base first. when a
+# drone is lost, a drone flying a less important slot takes over the lost
+# slot and its own slot is left empty. of those, the one closest to where the
+# lost slot flies next is picked whose handover flight, checked with
+# spatial.scan against where every other drone is going, keeps clear of them.
+# if none does the lost slot is left empty instead
+# a Timeline hands out the show's moves with slots mapped to drones at the
+# moment each move is pulled, so dropping a drone swaps the rest of the
+# timeline without regenerating anything. every section works out its
+# mapping when its first move comes out after a drop, from where the drones
+# are at that time. only every drone's last move is kept for that, so the
+# timeline's memory doesn't grow with the show
+
+import threading
+
+import numpy as np
+
+import pipeline
+import show
+import spatial
+
+
+# slots of a primitive from most to least important
+def slot_priority(primitive, n):
+    sums = np.zeros((n, 3))
+    counts = np.zeros(n)
+    for _, slot, command in primitive:
+        if type(command).__name__ == 'Goto':
+            sums[slot] += command[:3]
+            counts[slot] += 1
+    flying = counts > 0
+    mean = sums / np.maximum(counts, 1)[:, None]
+    centre = mean[flying].mean(axis=0) if flying.any() else np.zeros(3)
+    distance = np.linalg.norm((mean - centre)[:, :2], axis=1)
+    return np.lexsort((np.arange(n), distance, ~flying)).tolist()
+
+
+# picks the least important candidate, for tables used without a Timeline
+def least_important(slot, drone_of, candidates):
+    return candidates[-1]
+
+
+class AssignmentTable:
+    # slot -> drone of one section for every order of lost drones it was asked
+    # for. substitute(slot, drone_of, candidates) picks the slot whose drone
+    # takes over the lost slot from the candidates, the filled slots less
+    # important than it, or None to leave the lost slot empty
+
+    def __init__(self, priority, n):
+        self.priority = priority
+        self.cache = {(): {slot: slot for slot in range(n)}}
+
+    # slot -> drone for the drones that are left, given the lost drones in
+    # the order they were lost
+    def assign(self, lost, substitute=least_important):
+        if lost in self.cache:
+            return self.cache[lost]
+        drone_of = dict(self.assign(lost[:-1], substitute))
+        slot = next(slot for slot, flier in drone_of.items()
+                    if flier == lost[-1])
+        rank = self.priority.index(slot)
+        candidates = [other for other in self.priority[rank + 1:]
+                      if other in drone_of]
+        chosen = substitute(slot, drone_of, candidates) if candidates \
+            else None
+        if chosen is None:
+            del drone_of[slot]
+        else:
+            drone_of[slot] = drone_of.pop(chosen)
+        self.cache[lost] = drone_of
+        return drone_of
+
+
+class Timeline:
+    # iterating gives the (time, cf_id, command) moves of the planned
+    # sections in time order, with the slot assignment that is current when
+    # each move comes out. expand turns a plan into its moves, e.g.
+    # pipeline.expand_smooth to fly splines. dt is the time step handovers are
+    # checked at
+
+    def __init__(self, plans, n, expand=pipeline.expand,
+                 dt=show.SAMPLE_TIME):
+        self.plans = list(plans)
+        self.n = n
+        self.expand = expand
+        self.dt = dt
+        self.lost = ()
+        self.lock = threading.Lock()
+        # cf_id -> (time, position, command) of the last move handed out to
+        # every drone, with where the drone was when it started
+        self.moving = {}
+        priorities = {}
+        self.tables = []
+        for plan in self.plans:
+            key = id(plan.primitive)
+            if key not in priorities:
+                priorities[key] = slot_priority(plan.primitive, n)
+            self.tables.append(AssignmentTable(priorities[key], n))
+
+    # called from whichever thread notices the drone is gone
+    def drop(self, cf_id):
+        with self.lock:
+            if cf_id not in self.lost:
+                self.lost = self.lost + (cf_id,)
+
+    def __iter__(self):
+        streams = ((plan.step, self.section(index, plan))
+                   for index, plan in enumerate(self.plans))
+        for t, slot, command, index in pipeline.merge(streams):
+            lost = self.lost
+            table = self.tables[index]
+            if lost not in table.cache:
+                table.assign(lost, self.handover(index, t))
+            drone = table.cache[lost].get(slot)
+            if drone is not None:
+                self.follow(t, drone, command)
+                yield (t, drone, command)
+
+    def section(self, index, plan):
+        for t, slot, command in self.expand(*plan):
+            yield (t, slot, command, index)
+
+    # keeps the command as the drone's last move if it moves it. a drone's
+    # first goto lifts it off the ground below its target
+    def follow(self, t, cf_id, command):
+        last = self.moving.get(cf_id)
+        if last is None:
+            if type(command).__name__ == 'Goto':
+                self.moving[cf_id] = (t, (command.x, command.y, 0.0),
+                                      command)
+            return
+        if show.target_of(command, last[1]) is None:
+            return
+        started, position, previous = last
+        here = show.sample(show.compile_tracks(
+            [(started, 0, previous)], 1, np.array([position])), [t])[0, 0]
+        self.moving[cf_id] = (t, tuple(here.tolist()), command)
+
+    # tracks of the drones that are left flying their last move, then moves
+    def tracks(self, moves=()):
+        start = np.full((self.n, 3), np.nan)
+        current = []
+        for cf_id, (t, here, command) in self.moving.items():
+            if cf_id not in self.lost:
+                start[cf_id] = here
+                current.append((t, cf_id, command))
+        return show.compile_tracks(current + list(moves), self.n, start)
+
+    # substitute for AssignmentTable.assign when section index is taken over
+    # at time t: the candidate closest to the lost slot's next waypoint whose
+    # flight there keeps MIN_SEPARATION from every other drone
+    def handover(self, index, t):
+        remaining = [move for move in self.expand(*self.plans[index])
+                     if move[0] >= t]
+
+        def substitute(slot, drone_of, candidates):
+            last = self.moving.get(drone_of[slot])
+            there = (np.nan,) * 3 if last is None else last[1]
+            target = next(((start + command.time,
+                            show.target_of(command, there))
+                           for start, other, command in remaining
+                           if other == slot and
+                           show.target_of(command, there) is not None), None)
+            if target is None:
+                return None
+            arrival, target = target
+
+            lost = set(self.lost)
+            here = show.sample(self.tracks(), [t])[0]
+            distance = {other: np.linalg.norm(here[drone_of[other]] - target)
+                        for other in candidates}
+            times = np.arange(t, arrival + self.dt, self.dt)
+            for other in sorted((other for other in candidates
+                                 if not np.isnan(distance[other])),
+                                key=distance.get):
+                trial = dict(drone_of)
+                trial[slot] = trial.pop(other)
+                tracks = self.tracks(
+                    (start, trial[taken], command)
+                    for start, taken, command in remaining
+                    if taken in trial and trial[taken] not in lost)
+                violations = spatial.scan(times, show.sample(tracks, times))
+                if not any(trial[slot] in violation[1:3]
+                           for violation in violations):
+                    return other
+            return None
+
+        return substitute
@@ -0,0 +1,148 @@
+# turns a compiled sequence of (time, cf_id, command) into per-drone tracks
+# and samples every drone's position at any set of times
+# motion is modelled as a straight line at constant speed from wherever the
+# drone is when the command arrives to the command's target, which is close
+# enough to what the high level commander flies for checking and previews.
+# splines (see trajectory.py) follow their polynomials, with a keyframe every
+# SPLINE_STEP and on every knot
+
+from collections import namedtuple
+
+import numpy as np
+
+import trajectory
+
+# keyframes of one drone, times shape (k,) and positions shape (k, 3).
+# in between keyframes the drone moves in a straight line. moves shape (k,)
+# holds the MOVES code of the command flown into each keyframe, HOLD where the
+# drone sat still since the previous keyframe
+Track = namedtuple('Track', ['times', 'positions', 'moves'])
+
+# splines are flown as GOTO
+MOVES = ['Hold', 'Goto', 'Takeoff', 'Land']
+HOLD, GOTO, TAKEOFF, LAND = range(len(MOVES))
+
+# time step used when sampling a whole show
+SAMPLE_TIME = 0.1
+# time between the keyframes a spline is followed by
+SPLINE_STEP = 0.02
+
+
+# where the command sends a drone that is currently at `here`, or None if the
+# command doesn't move it. commands are matched by name so the namedtuples from
+# driver.py and primitives.py both work
+def target_of(command, here):
+    kind = type(command).__name__
+    if kind == 'Goto':
+        return (command.x, command.y, command.z)
+    if kind == 'Takeoff':
+        return (here[0], here[1], command.height)
+    if kind == 'Land':
+        return (here[0], here[1], 0.0)
+    if kind == 'Spline':
+        return tuple(spline_frames(0.0, command)[1][-1])
+    return None
+
+
+# times and positions of the keyframes of a Spline command flown from t0,
+# shape (k,) and (k, 3), up to and including its end
+def spline_frames(t0, command):
+    path = trajectory.from_pieces(command.pieces, t0)
+    times = np.union1d(np.arange(t0, path.knots[-1], SPLINE_STEP),
+                       path.knots)[1:]
+    return times, trajectory.evaluate(path, times)[:, 0]
+
+
+def compile_tracks(sequence, n, start=None):
+    # start is an optional (n, 3) array of positions at time 0. drones without
+    # one start on the ground below their first goto, commands before that
+    # can't be placed and are skipped
+    keyframes = [[] for _ in range(n)]
+    if start is not None:
+        for cf_id in range(n):
+            keyframes[cf_id].append((0.0, tuple(start[cf_id]), HOLD))
+
+    for t0, cf_id, command in sorted(sequence, key=lambda move: move[0]):
+        frames = keyframes[cf_id]
+        here = position_at(frames, t0) if frames else (0.0, 0.0, 0.0)
+        target = target_of(command, here)
+        kind = type(command).__name__
+        if target is None or not frames and kind != 'Goto':
+            continue
+        move = GOTO if kind == 'Spline' else MOVES.index(kind)
+        if frames:
+            # a new command cuts the move in progress short
+            cut = frames[-1][2] if frames[-1][0] > t0 else HOLD
+            while frames and frames[-1][0] > t0:
+                frames.pop()
+            frames.append((t0, here, cut))
+        else:
+            # the first goto lifts the drone off the ground
+            frames.append((t0, (target[0], target[1], 0.0), HOLD))
+            move = TAKEOFF
+        if kind == 'Spline':
+            times, positions = spline_frames(t0, command)
+            frames.extend((t, tuple(p), move) for t, p in
+                          zip(times.tolist(), positions.tolist()))
+        else:
+            frames.append((t0 + command.time, target, move))
+
+    tracks = []
+    for frames in keyframes:
+        if not frames:
+            frames = [(0.0, (np.nan, np.nan, np.nan), HOLD)]
+        tracks.append(Track(np.array([t for t, _, _ in frames], dtype=float),
+                            np.array([p for _, p, _ in frames], dtype=float),
+                            np.array([m for _, _, m in frames])))
+    return tracks
+
+
+# interpolates a keyframe list at t, only the last move can still be running
+# but a spline has many keyframes
+def position_at(frames, t):
+    i = len(frames) - 1
+    while i > 0 and frames[i - 1][0] > t:
+        i -= 1
+    t1, p1, _ = frames[i]
+    if t1 <= t or i == 0:
+        return p1
+    t0, p0, _ = frames[i - 1]
+    if t1 == t0:
+        return p1
+    f = (t - t0) / (t1 - t0)
+    return tuple(a + (b - a) * f for a, b in zip(p0, p1))
+
+
+def end_time(tracks):
+    return max(track.times[-1] for track in tracks)
+
+
+# positions of every drone at every time, shape (len(times), n, 3). drones
+# hold their first/last keyframe before/after their track
+def sample(tracks, times):
+    times = np.asarray(times, dtype=float)
+    positions = np.empty((len(times), len(tracks), 3))
+    for cf_id, track in enumerate(tracks):
+        for axis in range(3):
+            positions[:, cf_id, axis] = np.interp(times, track.times,
+                                                  track.positions[:, axis])
+    return positions
+
+
+# MOVES code of the command every drone is flying at the given times, shape
+# (len(times), n). before its first and after its last keyframe a drone holds
+def sample_moves(tracks, times):
+    times = np.asarray(times, dtype=float)
+    moves = np.full((len(times), len(tracks)), HOLD, dtype=np.int64)
+    for cf_id, track in enumerate(tracks):
+        frame = np.searchsorted(track.times, times, side='left')
+        during = frame < len(track.times)
+        moves[during, cf_id] = track.moves[frame[during]]
+    return moves
+
+
+# samples a whole sequence every dt seconds, returns (times, positions)
+def sample_show(sequence, n, dt=SAMPLE_TIME, start=None):
+    tracks = compile_tracks(sequence, n, start)
+    times = np.arange(0, end_time(tracks) + dt, dt)
+    return times, sample(tracks, times)
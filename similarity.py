@@ -0,0 +1,90 @@
+# finds repeated music so repeated passages reuse choreography
+# every segment gets a feature vector from its standardized timbre and its
+# pitches. the cosine self-similarity of all segments is computed a block of
+# rows at a time against the earlier segments only, so memory stays at
+# BLOCK x segments however long the song is. a repeat shows up as a diagonal
+# run of similar segments at a fixed lag; runs are tracked per lag while the
+# blocks stream past. sections whose segments mostly repeat an earlier section
+# are mapped onto it, and generate_sequence reuses that section's block
+
+import numpy as np
+
+import timing
+
+# rows of the similarity matrix computed at once
+BLOCK = 256
+# cosine similarity above which two segments count as the same
+SIMILARITY = 0.6
+# segments in a row that have to match before it counts as a repeat
+MIN_RUN = 4
+# share of a section's segments that have to repeat the same earlier section
+REPEAT_FRACTION = 0.6
+
+
+# unit length feature rows, shape (segments, 24)
+def features(segments):
+    timbre = np.array([segment['timbre'] for segment in segments], dtype=float)
+    pitches = np.array([segment['pitches'] for segment in segments],
+                       dtype=float)
+    timbre = (timbre - timbre.mean(axis=0)) / (timbre.std(axis=0) + 1e-9)
+    pitches = pitches - pitches.mean(axis=0)
+    rows = np.hstack([timbre / np.sqrt(timbre.shape[1]),
+                      pitches / np.sqrt(pitches.shape[1])])
+    return rows / (np.linalg.norm(rows, axis=1, keepdims=True) + 1e-9)
+
+
+# for every segment the earlier segment it repeats, or -1. a segment repeats
+# the one `lag` segments back if it ends a run of at least MIN_RUN similar
+# segments at that lag; the earlier segments of the run are marked too
+def segment_repeats(rows, block=BLOCK, similarity=SIMILARITY,
+                    min_run=MIN_RUN):
+    m = len(rows)
+    source = np.full(m, -1)
+    # run[lag] is how many segments in a row matched at that lag
+    run = np.zeros(m + 1, dtype=np.int64)
+    lags = np.arange(m + 1)
+
+    for start in range(0, m, block):
+        stop = min(start + block, m)
+        scores = rows[start:stop] @ rows[:stop].T
+        for i in range(start, stop):
+            # scores of segment i against i - lag for every lag >= 1
+            back = i - lags[1:i + 1]
+            matched = scores[i - start, back] >= similarity
+            run[1:i + 1] = np.where(matched, run[1:i + 1] + 1, 0)
+            run[i + 1:] = 0
+
+            lag = run.argmax()
+            length = run[lag]
+            if length >= min_run:
+                # prefer the longest run, and the nearest repeat on ties
+                lag = np.flatnonzero(run == length)[0]
+                for j in range(i - length + 1, i + 1):
+                    if source[j] < 0:
+                        source[j] = j - lag
+    return source
+
+
+# for every section the index of the earlier section it repeats, or None
+def section_repeats(analysis):
+    segments = analysis['segments']
+    sections = analysis['sections']
+    lookup = timing.index_of(analysis)
+    source = segment_repeats(features(segments))
+    owner = lookup.at('sections', lookup.starts['segments'])
+
+    repeats = []
+    for index in range(len(sections)):
+        mine = np.flatnonzero(owner == index)
+        matched = source[mine]
+        earlier = owner[matched[matched >= 0]]
+        earlier = earlier[(earlier >= 0) & (earlier < index)]
+        if not len(mine) or not len(earlier):
+            repeats.append(None)
+            continue
+        best = np.bincount(earlier).argmax()
+        if np.count_nonzero(earlier == best) >= REPEAT_FRACTION * len(mine):
+            repeats.append(best.item())
+        else:
+            repeats.append(None)
+    return repeats
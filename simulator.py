@@ -0,0 +1,30 @@
+# a swarm that only exists in memory
+# takes commands the way the control queues do, stamped with the show time
+# they were sent at, and flies them with the straight line model from show.py
+# so positions, separation and envelope checks can be run on what was
+# actually sent
+
+import numpy as np
+
+import show
+
+
+class SimulatedSwarm:
+
+    def __init__(self, n, start=None):
+        self.n = n
+        self.start = start
+        self.received = []
+        self.now = 0.0
+
+    def send(self, cf_id, command, at=None):
+        if at is None:
+            at = self.now
+        self.received.append((at, cf_id, command))
+
+    def tracks(self):
+        return show.compile_tracks(self.received, self.n, self.start)
+
+    # positions of every drone at the given times, shape (len(times), n, 3)
+    def positions(self, times):
+        return show.sample(self.tracks(), np.atleast_1d(times))
@@ -0,0 +1,142 @@
+# uniform grid (cell list) spatial index for separation checks
+# points are bucketed into cubic cells as big as the query radius, so a
+# neighbour can only be in the same or one of the 26 surrounding cells. that
+# keeps separation checks near linear in the number of drones instead of
+# looking at every pair. points can carry a group (e.g. the time slice they
+# were sampled at) and only points of the same group are neighbours, so a
+# whole sampled show is checked in one pass
+
+from collections import namedtuple
+
+import numpy as np
+
+import show
+
+# closest two drones may get to each other, in metres
+MIN_SEPARATION = 0.3
+# drones below this height are sitting on their pads and aren't checked
+GROUND = 0.05
+
+# two drones closer than MIN_SEPARATION at time t
+Violation = namedtuple('Violation', ['time', 'cf_a', 'cf_b', 'distance'])
+
+OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1)
+                    for dy in (-1, 0, 1) for dz in (-1, 0, 1)])
+
+
+class GridIndex:
+
+    def __init__(self, points, cell, groups=None):
+        # points shape (m, 3), rows with NaN are left out of the index
+        self.points = np.asarray(points, dtype=float)
+        self.cell = cell
+        valid = ~np.isnan(self.points).any(axis=1)
+        self.ids = valid.nonzero()[0]
+
+        if groups is None:
+            groups = np.zeros(len(self.points), dtype=np.int64)
+        groups = np.asarray(groups, dtype=np.int64)[self.ids]
+
+        cells = np.floor(self.points[self.ids] / cell).astype(np.int64)
+        if len(cells):
+            # one spare cell on every side so neighbour offsets never wrap
+            cells -= cells.min(axis=0) - 1
+            dims = cells.max(axis=0) + 2
+        else:
+            dims = np.ones(3, dtype=np.int64)
+        self.strides = np.array([dims[1] * dims[2], dims[2], 1])
+        keys = groups * dims.prod() + cells @ self.strides
+
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.sorted_ids = self.ids[order]
+        self.unique_keys, self.starts, self.counts = np.unique(
+            self.keys, return_index=True, return_counts=True)
+        self.point_keys = np.full(len(self.points), -1, dtype=np.int64)
+        self.point_keys[self.ids] = keys
+
+    # ids of every indexed point in the cells next to the given keys. returns
+    # (source, candidate) where source indexes into `keys`
+    def candidates(self, keys):
+        sources = []
+        found = []
+        for offset in OFFSETS @ self.strides:
+            wanted = keys + offset
+            slot = np.searchsorted(self.unique_keys, wanted)
+            slot = np.minimum(slot, len(self.unique_keys) - 1)
+            hit = (self.unique_keys[slot] == wanted).nonzero()[0]
+            counts = self.counts[slot[hit]]
+            total = counts.sum()
+            # expand every hit cell into the run of sorted ids it covers
+            run_starts = np.repeat(self.starts[slot[hit]], counts)
+            run_offsets = np.arange(total) - np.repeat(counts.cumsum() - counts,
+                                                       counts)
+            sources.append(np.repeat(hit, counts))
+            found.append(self.sorted_ids[run_starts + run_offsets])
+        return np.concatenate(sources), np.concatenate(found)
+
+    # ids of all points within radius of point i, radius must be <= cell
+    def neighbors(self, i, radius):
+        if self.point_keys[i] < 0 or not len(self.unique_keys):
+            return np.empty(0, dtype=np.int64)
+        _, found = self.candidates(self.point_keys[i:i + 1])
+        found = found[found != i]
+        distance = np.linalg.norm(self.points[found] - self.points[i], axis=1)
+        return np.sort(found[distance < radius])
+
+    # every pair (a, b) with a < b closer than radius, radius must be <= cell.
+    # returns (pairs shape (p, 2), distances shape (p,))
+    def pairs_within(self, radius):
+        if not len(self.unique_keys):
+            return np.empty((0, 2), dtype=np.int64), np.empty(0)
+        sources, found = self.candidates(self.keys)
+        sources = self.sorted_ids[sources]
+        # every pair turns up from both sides, keep one
+        keep = sources < found
+        sources, found = sources[keep], found[keep]
+        distance = np.linalg.norm(self.points[sources] - self.points[found],
+                                  axis=1)
+        close = distance < radius
+        pairs = np.stack([sources[close], found[close]], axis=1)
+        return pairs, distance[close]
+
+
+# checks drone positions sampled over time, shape (len(times), n, 3), for
+# airborne pairs closer than min_separation. returns the violations ordered
+# by time
+def scan(times, positions, min_separation=MIN_SEPARATION):
+    steps, n, _ = positions.shape
+    points = positions.reshape(-1, 3).copy()
+    points[points[:, 2] < GROUND] = np.nan
+    groups = np.repeat(np.arange(steps), n)
+    index = GridIndex(points, min_separation, groups)
+    pairs, distance = index.pairs_within(min_separation)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0], pairs[:, 0] // n))
+    return [Violation(times[a // n].item(), (a % n).item(), (b % n).item(),
+                      d.item())
+            for (a, b), d in zip(pairs[order], distance[order])]
+
+
+# generation time check of a compiled sequence
+def check_sequence(sequence, n, min_separation=MIN_SEPARATION,
+                   dt=show.SAMPLE_TIME):
+    times, positions = show.sample_show(sequence, n, dt)
+    return scan(times, positions, min_separation)
+
+
+class SeparationMonitor:
+    # live check of logged positions, feed it from the position log callbacks
+    # and call check() whenever a fresh picture is wanted
+
+    def __init__(self, n, min_separation=MIN_SEPARATION):
+        self.positions = np.full((n, 3), np.nan)
+        self.min_separation = min_separation
+
+    def update(self, cf_id, x, y, z):
+        self.positions[cf_id] = (x, y, z)
+
+    def check(self):
+        index = GridIndex(self.positions, self.min_separation)
+        pairs, distance = index.pairs_within(self.min_separation)
+        return [(a.item(), b.item(), d.item())
+                for (a, b), d in zip(pairs, distance)]
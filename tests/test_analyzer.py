@@ -0,0 +1,45 @@
+# beats and segments of a click track land on its clicks
+
+import wave
+
+import numpy as np
+
+import analyzer
+
+RATE = 44100
+BPM = 128
+
+
+def click_track(path, seconds=20.0):
+    audio = np.zeros(int(RATE * seconds))
+    clicks = np.arange(0, seconds, 60 / BPM)
+    burst = np.random.RandomState(0).randn(200) * 0.5 * \
+        np.exp(-np.arange(200) / 60)
+    for click in clicks:
+        start = int(round(click * RATE))
+        audio[start:start + len(burst)] += burst[:len(audio) - start]
+    with wave.open(path, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(RATE)
+        output.writeframes((audio * 32000).astype('<i2').tobytes())
+    return clicks
+
+
+def test_beats_on_clicks(tmp_path):
+    path = str(tmp_path / 'clicks.wav')
+    clicks = click_track(path)
+    analysis = analyzer.analyze(path)
+
+    for name in ('beats', 'segments'):
+        starts = np.array([span['start'] for span in analysis[name]])
+        errors = starts - clicks[np.abs(clicks[:, None] - starts).argmin(
+            axis=0)]
+        assert abs(errors.mean()) < 0.015
+        assert np.abs(errors).max() < 0.025
+
+    # the click at the very start is an onset too
+    rate, _, chunks = analyzer.read(path)
+    _, flux, _, _ = analyzer.frame_features(chunks, rate)
+    assert flux.argmax() == 0
+    assert len(analysis['segments']) == len(clicks)
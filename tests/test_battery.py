@@ -0,0 +1,23 @@
+# energy of a drone doesn't depend on the tracks it is packed with
+
+import numpy as np
+
+import battery
+import show
+from primitives import Goto
+
+
+def test_padding_costs_nothing():
+    # cf 0 ends up hovering after two legs, cf 1 flies on
+    moves = [(0.0, 0, Goto(0.0, 0.0, 1.0, 1.0)),
+             (1.0, 0, Goto(1.0, 0.0, 1.0, 1.0)),
+             (0.0, 1, Goto(0.0, 1.0, 1.0, 1.0))] + \
+        [(t, 1, Goto(t, 1.0, 1.0, 1.0)) for t in range(1, 6)]
+    tracks = show.compile_tracks(moves, 2)
+    assert len(tracks[0].times) < len(tracks[1].times)
+
+    end = show.end_time(tracks)
+    packed = battery.energy(*battery.pack(tracks), end)
+    alone = [battery.energy(*battery.pack([track]), end)[0]
+             for track in tracks]
+    assert np.allclose(packed, alone)
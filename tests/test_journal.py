@@ -0,0 +1,27 @@
+# journals written and read back, and replayed into a simulated swarm
+
+import numpy as np
+
+import journal
+import pipeline
+import primitives
+import show
+import simulator
+
+N = primitives.NUM_DRONES
+
+
+def test_smoothed_section_replays(tmp_path):
+    moves = list(pipeline.expand_smooth(0, primitives.kickline, 7.0))
+    path = str(tmp_path / 'show.cfj')
+    writer = journal.JournalWriter(path, start=0)
+    for move in moves:
+        writer.queue.put(move)
+    writer.close()
+
+    assert [type(command) for _, _, command in journal.read(path)] == \
+        [type(command) for _, _, command in moves]
+    swarm = journal.replay(path, simulator.SimulatedSwarm(N))
+    times = np.linspace(0, 8, 81)
+    expected = show.sample(show.compile_tracks(moves, N), times)
+    assert np.nanmax(np.abs(swarm.positions(times) - expected)) < 1e-4
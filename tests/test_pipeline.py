@@ -0,0 +1,74 @@
+# every primitive warped onto the beats of every section of the bundled song
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import pipeline
+import primitives
+import timing
+
+ANALYSIS = os.path.join(os.path.dirname(__file__), '..', 'audio_analysis.json')
+PRIMITIVES = ['rotating_tower', 'kickline', 'wave', 'soloist', 'cube']
+
+
+@pytest.fixture(scope='module')
+def analysis():
+    with open(ANALYSIS, 'r') as analysis_file:
+        return json.load(analysis_file)
+
+
+@pytest.mark.parametrize('name', PRIMITIVES)
+def test_beat_grid_fits_every_section(analysis, name):
+    primitive = getattr(primitives, name)
+    lookup = timing.index_of(analysis)
+    beats, downbeats = lookup.starts['beats'], lookup.starts['bars']
+    gridded = 0
+    for section in analysis['sections']:
+        step, duration = section['start'], section['duration']
+        grid = pipeline.beat_grid(beats, downbeats, step, duration, primitive)
+        if grid is None:
+            continue
+        gridded += 1
+        per_step, grid_beats = grid
+        assert per_step % pipeline.step_quantum(primitive) == 0
+        assert len(grid_beats) == np.ceil(primitive[-1][0]) * per_step + 1
+
+        moves = list(pipeline.expand(step, primitive, duration, grid))
+        times = [t for t, _, _ in moves]
+        assert len(moves) == len(primitive)
+        assert times == sorted(times)
+        assert all(command.time >= 0 for _, _, command in moves)
+        # every step lands on a beat
+        for (t, _, _), (start, _, _) in zip(primitive, moves):
+            position = t * per_step
+            assert position == pytest.approx(round(position))
+            assert start == pytest.approx(grid_beats[round(position)])
+    assert gridded
+
+
+def test_warp_between_and_past_the_beats():
+    beats = np.array([0.0, 1.0, 3.0])
+    assert pipeline.warp(np.array([0.5, 1.5, 2.0, 2.5]), beats).tolist() == \
+        [0.5, 2.0, 3.0, 4.0]
+
+
+def test_repeated_sections_retime_their_source(analysis):
+    plans = list(pipeline.plan(analysis))
+    repeats = [plan for plan in plans if plan.block is not None]
+    assert repeats
+    for plan in repeats:
+        # the block is replayed, not expanded again, and keeps every move on
+        # the section's own beats
+        assert list(pipeline.expand(*plan._replace(primitive=None))) == \
+            list(pipeline.expand(*plan._replace(block=None)))
+
+    block = pipeline.Block(0.0, list(pipeline.expand(0.0, primitives.kickline,
+                                                     7.0)), 7.0, None)
+    moves = list(pipeline.retime(block, 10.0, 14.0))
+    assert [t for t, _, _ in moves] == [10.0 + 2 * t for t, _, _ in
+                                        block.moves]
+    assert [command.time for _, _, command in moves] == \
+        [2 * command.time for _, _, command in block.moves]
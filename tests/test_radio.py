@@ -0,0 +1,49 @@
+# commands through the link scheduler over a simulated link
+
+import pipeline
+import primitives
+import radio
+from pipeline import Plan
+from primitives import Goto, Land, Ring, Upload
+
+URIS = radio.make_uris(primitives.NUM_DRONES)
+
+
+def sent(link, cf_id):
+    return [command for _, _, flier, command in link.packets
+            if flier == cf_id]
+
+
+def test_every_drone_gets_its_commands_in_sequence_order():
+    plans = [Plan(0, primitives.kickline, 7.0),
+             Plan(7.0, primitives.soloist, 7.5)]
+    sequence = list(pipeline.merge((plan.step, pipeline.expand(*plan))
+                                   for plan in plans))
+    _, link = radio.simulate(sequence, URIS)
+    for cf_id in range(primitives.NUM_DRONES):
+        assert sent(link, cf_id) == [command for _, flier, command in sequence
+                                     if flier == cf_id]
+
+
+def test_priority_only_orders_different_drones():
+    # two packets a tick, so the commands have to wait their turn
+    sequence = [(0.0, 0, Ring(255, 0, 0, 1.0, 0.1)),
+                (0.0, 1, Goto(0.0, 0.0, 1.0, 1.0)),
+                (0.0, 0, Land(1.0)),
+                (0.0, 2, Land(1.0))]
+    _, link = radio.simulate(sequence, URIS, packets_per_tick=2)
+    order = [(cf_id, type(command).__name__)
+             for _, _, cf_id, command in link.packets]
+    assert order.index((0, 'Ring')) < order.index((0, 'Land'))
+    assert order[0] == (2, 'Land')
+    assert order.index((1, 'Goto')) < order.index((0, 'Ring'))
+
+
+def test_big_commands_use_up_the_ticks_after_them():
+    pieces = [(1.0, [0.0] * 8, [0.0] * 8, [0.0] * 8)]
+    sequence = [(0.0, 0, Upload(pieces, 0.0)),
+                (0.01, 1, Goto(0.0, 0.0, 1.0, 1.0))]
+    _, link = radio.simulate(sequence, URIS, packets_per_tick=5)
+    ticks = {cf_id: tick for tick, _, cf_id, _ in link.packets}
+    # the upload's 32 packets use up ticks 0 to 5 and 2 packets of tick 6
+    assert ticks == {0: 0, 1: radio.PACKETS['Upload'] // 5}
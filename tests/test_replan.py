@@ -0,0 +1,87 @@
+# drops drones from a replan.Timeline while its coalesced moves are pulled,
+# the way driver.py flies a show
+
+import json
+import os
+
+import coalesce
+import pipeline
+import primitives
+import replan
+import spatial
+
+ANALYSIS = os.path.join(os.path.dirname(__file__), '..', 'audio_analysis.json')
+N = primitives.NUM_DRONES
+
+
+def load_analysis():
+    with open(ANALYSIS, 'r') as analysis_file:
+        return json.load(analysis_file)
+
+
+# drops every cf_id once a move at or after its time has come out. returns
+# the timeline, the moves, and per drop how many moves had come out and how
+# many the timeline had handed to coalesce by then
+def fly(drops, expand=pipeline.expand):
+    timeline = replan.Timeline(pipeline.plan(load_analysis()), N, expand)
+    upstream = []
+
+    def counted():
+        for move in timeline:
+            upstream.append(move)
+            yield move
+
+    moves = []
+    pulled = {}
+    for move in coalesce.coalesce(counted(), lost=lambda: timeline.lost):
+        moves.append(move)
+        for cf_id, t in drops.items():
+            if cf_id not in pulled and move[0] >= t:
+                timeline.drop(cf_id)
+                pulled[cf_id] = (len(moves), len(upstream))
+    return timeline, moves, pulled
+
+
+def test_without_drops_every_drone_flies_its_slots():
+    timeline, moves, _ = fly({})
+    assert timeline.lost == ()
+    assert set(cf_id for _, cf_id, _ in moves) == set(range(N))
+    assert spatial.check_sequence(moves, N) == []
+
+
+def test_two_drops_in_turn():
+    everything = len(list(replan.Timeline(pipeline.plan(load_analysis()),
+                                          N)))
+    timeline, moves, pulled = fly({4: 60.0, 1: 120.0})
+    assert timeline.lost == (4, 1)
+
+    for cf_id, (out, _) in pulled.items():
+        # nothing more goes to a lost drone, not even a held back goto
+        assert [move for move in moves[out:] if move[1] == cf_id] == []
+    # the timeline is still pulled lazily after the first drop
+    assert pulled[1][1] < everything
+
+    # the drones that are left keep flying and take over the lost slots
+    # without getting too close to each other
+    after = set(cf_id for _, cf_id, _ in moves[pulled[1][0]:])
+    assert after == set(range(N)) - {4, 1}
+    tables = [table.cache[(4, 1)] for table in timeline.tables
+              if (4, 1) in table.cache]
+    assert tables and any(drone_of[4] != 4 for drone_of in tables
+                          if 4 in drone_of)
+    assert spatial.check_sequence(
+        [move for move in moves if move[1] not in (4, 1)], N) == []
+
+
+def test_lost_spline_slots_are_taken_over():
+    timeline, moves, pulled = fly({4: 15.0}, pipeline.expand_smooth)
+    out, _ = pulled[4]
+    taken = [move for move in moves[out:]
+             if type(move[2]).__name__ == 'Spline' and move[1] != 4]
+    assert len(set(cf_id for _, cf_id, _ in taken)) == N - 1
+    assert all(table.cache[(4,)].get(4) not in (None, 4)
+               for table in timeline.tables if (4,) in table.cache)
+    assert spatial.check_sequence(
+        [move for move in moves if move[1] != 4], N) == []
+    # only the last move of every drone is kept
+    assert len(timeline.moving) <= N
@@ -0,0 +1,27 @@
+# splines in compiled tracks follow their polynomials
+
+import numpy as np
+
+import pipeline
+import primitives
+import show
+import trajectory
+
+N = primitives.NUM_DRONES
+
+
+def test_spline_tracks_follow_the_fit():
+    moves = list(pipeline.expand(0, primitives.kickline, 7.0))
+    smoothed = trajectory.smooth(moves, N)
+    start, fit = trajectory.for_moves(moves, N)
+    times = start + np.linspace(0, fit.knots[-1], 50)
+
+    positions = show.sample(show.compile_tracks(smoothed, N), times)
+    expected = trajectory.evaluate(fit._replace(knots=fit.knots + start),
+                                   times)
+    assert np.abs(positions - expected).max() < 1e-3
+    # the overshoot between waypoints shows up in the checks
+    lowest = min(command.z for _, _, command in moves)
+    assert positions[:, :, 2].min() < lowest - 0.01
+    assert np.allclose(show.target_of(smoothed[-1][2], None),
+                       expected[-1, smoothed[-1][1]])
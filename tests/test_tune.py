@@ -0,0 +1,10 @@
+# the hand-picked geometry tune.py starts from is the one the show flies
+
+import primitives
+import tune
+
+
+def test_defaults_rebuild_primitives():
+    geometry = tune.defaults()
+    for name in tune.GENERATORS:
+        assert tune.build(name, geometry[name]) == getattr(primitives, name)
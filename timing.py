@@ -0,0 +1,89 @@
+# time index over an audio analysis
+# bars, beats, tatums, segments and sections are all (start, duration) lists
+# sorted by start. the index keeps their starts and ends as arrays so "which
+# beat is playing at t" and "every beat in [t0, t1)" are binary searches,
+# for one time or a whole array of them at once, and keeps any field asked
+# for (loudness, pitches, ...) as an array so lookups stay vectorized.
+# index_of() keeps only the index of the analysis it was last asked for, so
+# every caller planning a show shares one index without keeping the earlier
+# analyses alive
+
+import numpy as np
+
+KINDS = ['bars', 'beats', 'tatums', 'segments', 'sections']
+
+# index of the analysis last asked for, see index_of
+_last = None
+
+
+class AnalysisIndex:
+
+    def __init__(self, analysis):
+        self.analysis = analysis
+        self.starts = {}
+        self.ends = {}
+        self.fields = {}
+        for kind in KINDS:
+            items = analysis.get(kind, [])
+            self.starts[kind] = np.array([item['start'] for item in items],
+                                         dtype=float)
+            self.ends[kind] = self.starts[kind] + np.array(
+                [item['duration'] for item in items], dtype=float)
+
+    def __len__(self):
+        return len(self.starts['segments'])
+
+    def count(self, kind):
+        return len(self.starts[kind])
+
+    # index of the item of a kind playing at t, -1 where none is. t can be a
+    # number or an array of times
+    def at(self, kind, t):
+        t = np.asarray(t, dtype=float)
+        index = np.searchsorted(self.starts[kind], t, side='right') - 1
+        inside = (index >= 0) & (t < self.ends[kind][np.maximum(index, 0)]) \
+            if self.count(kind) else np.zeros(t.shape, dtype=bool)
+        index = np.where(inside, index, -1)
+        return index.item() if index.ndim == 0 else index
+
+    # the item playing at t, or None
+    def item(self, kind, t):
+        index = self.at(kind, t)
+        return None if index < 0 else self.analysis[kind][index]
+
+    # (first, stop) indices of the items of a kind starting in [t0, t1)
+    def span(self, kind, t0, t1):
+        first, stop = np.searchsorted(self.starts[kind], [t0, t1])
+        return int(first), int(stop)
+
+    def between(self, kind, t0, t1):
+        first, stop = self.span(kind, t0, t1)
+        return self.analysis[kind][first:stop]
+
+    # index of the item of a kind starting closest to t, for arrays too
+    def nearest(self, kind, t):
+        starts = self.starts[kind]
+        t = np.asarray(t, dtype=float)
+        after = np.clip(np.searchsorted(starts, t), 1, len(starts) - 1)
+        before = after - 1
+        index = np.where(np.abs(t - starts[before]) <=
+                         np.abs(starts[after] - t), before, after) \
+            if len(starts) > 1 else np.zeros(t.shape, dtype=np.int64)
+        return index.item() if index.ndim == 0 else index
+
+    # a field of every item of a kind as an array, e.g. ('segments',
+    # 'pitches') gives shape (segments, 12). built on first use
+    def field(self, kind, name):
+        key = (kind, name)
+        if key not in self.fields:
+            self.fields[key] = np.array([item[name] for item in
+                                         self.analysis[kind]], dtype=float)
+        return self.fields[key]
+
+
+# the index of an analysis, built unless it is the one last asked for
+def index_of(analysis):
+    global _last
+    if _last is None or _last.analysis is not analysis:
+        _last = AnalysisIndex(analysis)
+    return _last
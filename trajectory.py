@@ -0,0 +1,214 @@
+# smooth trajectories through the goto waypoints of a primitive
+# instead of flying every Goto as its own stop-and-go move, each drone gets a
+# piecewise polynomial through its waypoints that minimizes jerk (degree 5) or
+# snap (degree 7). the minimum-derivative spline is the one that passes the
+# waypoints, starts and ends at rest and is continuous up to the 2r-2th
+# derivative, which makes the constraints a square linear system. all drones
+# of a section share the knot times, so the system is built once and solved
+# for every drone and axis at the same time. fits are cached on the piece
+# durations and waypoints themselves, so sections only share a fit when they
+# really fly the same thing at the same timing
+# the pieces use the Crazyflie's poly4d layout: per piece a duration and 8
+# ascending coefficients per axis in local time. smooth() turns a section's
+# gotos into one Spline command per drone, which driver.py starts through the
+# high level commander when run with --smooth. the pieces are uploaded ahead
+# of it by an Upload sent with the drone's first goto of the section
+
+from collections import namedtuple
+from functools import lru_cache
+from math import factorial
+
+import numpy as np
+
+# which derivative is minimized
+JERK = 3
+SNAP = 4
+
+# knots shape (m + 1,), coeffs shape (m, degree + 1, n, 3) with ascending
+# powers of the time since the start of each piece
+Trajectory = namedtuple('Trajectory', ['knots', 'coeffs'])
+
+# command flying one drone along pieces in the poly4d layout of
+# poly4d_pieces, time is their total duration. shared with primitives.py
+Spline = namedtuple('Spline', ['pieces', 'time'])
+# writes a Spline's pieces to the drone's trajectory memory before it is due,
+# time is always 0
+Upload = namedtuple('Upload', ['pieces', 'time'])
+
+# the high level commander takes 8 coefficients per axis
+POLY4D_COEFFS = 8
+
+_fits = {}
+
+
+# arrival times and positions of every drone's gotos in (time, cf_id,
+# command) moves, shape (k,) and (n, k, 3). drones hold their last waypoint on
+# knots where they get no goto, drones that never get one are NaN
+def waypoints(moves, n):
+    gotos = [(t + command.time, cf_id, command) for t, cf_id, command in moves
+             if type(command).__name__ == 'Goto']
+    knots = np.unique([arrival for arrival, _, _ in gotos])
+
+    positions = np.full((n, len(knots), 3), np.nan)
+    for arrival, cf_id, command in gotos:
+        positions[cf_id, np.searchsorted(knots, arrival)] = command[:3]
+
+    # forward fill, then back fill the knots before a drone's first goto
+    positions = _forward_fill(positions)
+    return knots, _forward_fill(positions[:, ::-1])[:, ::-1]
+
+
+def _forward_fill(positions):
+    valid = ~np.isnan(positions[:, :, 0])
+    steps = np.arange(positions.shape[1])
+    last = np.maximum.accumulate(np.where(valid, steps, 0), axis=1)
+    return np.take_along_axis(positions, last[:, :, None], axis=1)
+
+
+# row of the d-th derivative of a polynomial at local time t
+def _derivative_row(d, t, degree):
+    row = np.zeros(degree + 1)
+    for k in range(d, degree + 1):
+        row[k] = factorial(k) // factorial(k - d) * t ** (k - d)
+    return row
+
+
+# inverse of the constraint matrix for the given piece durations, shared by
+# every fit with the same timing
+@lru_cache(maxsize=64)
+def _system(durations, r):
+    degree = 2 * r - 1
+    m = len(durations)
+    size = degree + 1
+    A = np.zeros((m * size, m * size))
+    row = 0
+
+    # every piece starts and ends on its waypoints
+    for i, T in enumerate(durations):
+        A[row, i * size:(i + 1) * size] = _derivative_row(0, 0, degree)
+        A[row + 1, i * size:(i + 1) * size] = _derivative_row(0, T, degree)
+        row += 2
+
+    # at rest on both ends
+    for d in range(1, r):
+        A[row, :size] = _derivative_row(d, 0, degree)
+        A[row + 1, (m - 1) * size:] = _derivative_row(d, durations[-1],
+                                                      degree)
+        row += 2
+
+    # smooth through every inner waypoint
+    for i in range(m - 1):
+        for d in range(1, 2 * r - 1):
+            A[row, i * size:(i + 1) * size] = _derivative_row(
+                d, durations[i], degree)
+            A[row, (i + 1) * size:(i + 2) * size] = -_derivative_row(
+                d, 0, degree)
+            row += 1
+
+    return np.linalg.inv(A)
+
+
+def fit(knots, positions, r=SNAP):
+    # positions shape (n, k, 3) on the knots shape (k,), k >= 2
+    durations = tuple(np.diff(knots).tolist())
+    m = len(durations)
+    n = positions.shape[0]
+    size = 2 * r
+
+    # the right hand side only has the waypoints, in the rows that pin the
+    # start and end of each piece. one column per drone and axis
+    rhs = np.zeros((m * size, n * 3))
+    flat = positions.transpose(1, 0, 2).reshape(len(knots), n * 3)
+    rhs[0:2 * m:2] = flat[:-1]
+    rhs[1:2 * m:2] = flat[1:]
+
+    coeffs = _system(durations, r) @ rhs
+    return Trajectory(np.asarray(knots, dtype=float),
+                      coeffs.reshape(m, size, n, 3))
+
+
+# (first arrival, trajectory) fitted through the gotos of a section's moves,
+# with knots counted from the first arrival. fits are reused for every
+# section with the same piece durations and waypoints
+def for_moves(moves, n, r=SNAP):
+    knots, positions = waypoints(moves, n)
+    key = (np.diff(knots).round(6).tobytes(), positions.round(6).tobytes(),
+           positions.shape, r)
+    if key not in _fits:
+        _fits[key] = fit(knots - knots[0], positions, r)
+    return knots[0].item(), _fits[key]
+
+
+def clear_cache():
+    _fits.clear()
+    _system.cache_clear()
+
+
+# the trajectory of one drone's poly4d pieces, such as a Spline command's,
+# with the knots counted from start
+def from_pieces(pieces, start=0.0):
+    durations = [piece[0] for piece in pieces]
+    knots = start + np.concatenate([[0.0], np.cumsum(durations)])
+    coeffs = np.array([piece[1:] for piece in pieces], dtype=float)
+    return Trajectory(knots, coeffs.transpose(0, 2, 1)[:, :, None, :])
+
+
+# positions of every drone at the given times, shape (len(times), n, 3).
+# outside the knots drones hold the first/last waypoint
+def evaluate(trajectory, times, derivative=0):
+    knots, coeffs = trajectory
+    times = np.clip(np.asarray(times, dtype=float), knots[0], knots[-1])
+    piece = np.clip(np.searchsorted(knots, times, side='right') - 1, 0,
+                    len(coeffs) - 1)
+    t = (times - knots[piece])[:, None, None]
+
+    degree = coeffs.shape[1] - 1
+    # horner's rule on the derivative's coefficients, all times at once
+    result = np.zeros((len(times),) + coeffs.shape[2:])
+    for k in range(degree, derivative - 1, -1):
+        factor = factorial(k) // factorial(k - derivative)
+        result = result * t + factor * coeffs[piece, k]
+    return result
+
+
+# the pieces of one drone in poly4d layout: (duration, x, y, z) with 8
+# coefficients per axis, ready to upload to the drone's trajectory memory
+def poly4d_pieces(trajectory, cf_id):
+    knots, coeffs = trajectory
+    pieces = []
+    for i, duration in enumerate(np.diff(knots)):
+        axes = np.zeros((3, POLY4D_COEFFS))
+        axes[:, :coeffs.shape[1]] = coeffs[i, :, cf_id, :].T
+        pieces.append((duration.item(), axes[0].tolist(), axes[1].tolist(),
+                       axes[2].tolist()))
+    return pieces
+
+
+# a section's moves with every drone's gotos after its first one replaced by
+# a Spline through the remaining waypoints, starting when the first gotos
+# arrive, and an Upload of its pieces with the first goto. sections with
+# anything but gotos, or whose drones don't all arrive on the first knot, are
+# left as they are
+def smooth(moves, n, r=SNAP):
+    moves = list(moves)
+    if any(type(command).__name__ != 'Goto' for _, _, command in moves):
+        return moves
+    first = {}
+    for move in moves:
+        first.setdefault(move[1], move)
+    arrivals = set(round(t + command.time, 6)
+                   for t, _, command in first.values())
+    if len(arrivals) != 1 or len(set(round(t + command.time, 6)
+                                     for t, _, command in moves)) < 2:
+        return moves
+
+    start, trajectory = for_moves(moves, n, r)
+    smoothed = list(first.values())
+    for cf_id in sorted(first):
+        pieces = poly4d_pieces(trajectory, cf_id)
+        smoothed.append((first[cf_id][0], cf_id, Upload(pieces, 0.0)))
+        smoothed.append((start, cf_id, Spline(
+            pieces, sum(piece[0] for piece in pieces))))
+    smoothed.sort(key=lambda move: move[0])
+    return smoothed
+
@@ -0,0 +1,208 @@
+# searches the geometry of the formation primitives for the song at hand
+# the hand-picked primitives.GEOMETRY holds the keyword arguments of the
+# generators in formations.py. every candidate setting rebuilds the
+# primitives the show flies, recompiles the planned show with them and scores
+# it: separation and envelope violations, how close drones get, moves faster
+# than MAX_SPEED and how far drones travel between sections. candidates are
+# scored in a process pool, a few rounds at a time, each round sampling
+# closer around the best so far. run as
+#   python tune.py [audio_analysis.json]
+
+import json
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import coalesce
+import formations
+import geofence
+import pipeline
+import primitives
+import show
+import spatial
+
+# generator and move time of every tunable primitive, as in primitives.py
+GENERATORS = {
+    'rotating_tower': (formations.rotating_tower, 2.5),
+    'kickline': (formations.kickline, 1),
+    'wave': (formations.wave, 1),
+    'cube': (formations.rotating_cube, 2.5),
+}
+
+# range every parameter is searched in, metres
+RANGES = {
+    'rotating_tower': {'x_base': (0.5, 1.2), 'x_mid': (0.3, 0.8),
+                       'z_base': (0.4, 1.0), 'z_mid': (0.8, 1.5),
+                       'z_top': (1.2, 2.2)},
+    'kickline': {'x_min': (-1.9, -0.8), 'x_max': (0.8, 1.9),
+                 'z_base': (0.8, 1.6), 'z_low': (0.4, 1.2)},
+    'wave': {'x_min': (-1.9, -0.8), 'x_max': (0.8, 1.9),
+             'z_bot': (0.4, 1.0), 'z_top': (1.1, 2.2)},
+    'cube': {'x_in': (0.3, 0.9), 'z_out': (0.4, 1.0), 'z_mid': (1.2, 2.2),
+             'z_in': (0.8, 1.6)},
+}
+
+# fastest a move should be flown, m/s
+MAX_SPEED = 1.5
+# pairs closer than this cost a little even without a violation, metres
+COMFORTABLE_SEPARATION = 0.5
+# weights of the score terms, lower scores are better
+WEIGHTS = {
+    'separation': 1000.0,  # per sample of a pair closer than MIN_SEPARATION
+    'envelope': 1000.0,    # per sample of a drone outside the envelope
+    'crowding': 10.0,      # per metre short of COMFORTABLE_SEPARATION
+    'speed': 100.0,        # per metre flown above MAX_SPEED
+    'transition': 1.0,     # per metre flown into the start of a section
+}
+
+CANDIDATES = 64
+ROUNDS = 3
+# spread of the samples around the best setting in the second round, as a
+# share of every range. it halves each round after
+SPREAD = 0.25
+
+# the planned show every worker scores against, set by _init
+_plans = None
+_names = None
+
+
+# the geometry primitives.py uses, {primitive: {parameter: value}}
+def defaults():
+    return {name: {key: float(primitives.GEOMETRY[name][key])
+                   for key in RANGES[name]}
+            for name in GENERATORS}
+
+
+def build(name, values, n=primitives.NUM_DRONES):
+    generator, move_time = GENERATORS[name]
+    return primitives.from_formation(*generator(n, **values),
+                                     move_time=move_time)
+
+
+# name of the tunable primitive every plan flies, None for the others
+def primitive_names(plans):
+    by_id = {id(getattr(primitives, name)): name for name in GENERATORS}
+    return [by_id.get(id(plan.primitive)) for plan in plans]
+
+
+def score(plans, names, geometry, n=primitives.NUM_DRONES,
+          dt=show.SAMPLE_TIME):
+    built = {name: build(name, geometry[name], n) for name in set(names)
+             if name is not None}
+    # repeated sections are expanded from the tuned primitive too
+    plans = [plan if name is None else
+             plan._replace(primitive=built[name], block=None)
+             for plan, name in zip(plans, names)]
+    sequence = list(coalesce.coalesce(pipeline.merge(
+        (plan.step, pipeline.expand(*plan)) for plan in plans)))
+
+    tracks = show.compile_tracks(sequence, n)
+    times = np.arange(0, show.end_time(tracks) + dt, dt)
+    positions = show.sample(tracks, times)
+    terms = {}
+
+    close = spatial.scan(times, positions, COMFORTABLE_SEPARATION)
+    distance = np.array([violation.distance for violation in close])
+    terms['separation'] = int(np.sum(distance < spatial.MIN_SEPARATION))
+    terms['crowding'] = float(np.sum(COMFORTABLE_SEPARATION - distance))
+
+    masks = geofence.check_positions(positions, show.sample_moves(tracks,
+                                                                  times))
+    terms['envelope'] = int(sum(mask.sum() for mask in masks.values()))
+
+    speed = np.linalg.norm(np.diff(positions, axis=0), axis=2) / dt
+    terms['speed'] = float(np.nansum(np.maximum(speed - MAX_SPEED, 0)) * dt)
+
+    # distance from where every drone is when a section starts to its first
+    # target in that section
+    steps = np.array([plan.step for plan in plans[1:]])
+    at_start = show.sample(tracks, steps)
+    transition = 0.0
+    for plan, here in zip(plans[1:], at_start):
+        first = {}
+        for _, cf_id, command in plan.primitive:
+            if type(command).__name__ == 'Goto' and cf_id not in first:
+                first[cf_id] = command[:3]
+        for cf_id, target in first.items():
+            transition += np.linalg.norm(np.subtract(target, here[cf_id]))
+    terms['transition'] = float(transition)
+
+    total = sum(WEIGHTS[term] * value for term, value in terms.items())
+    return total, terms
+
+
+def _init(plans, names):
+    global _plans, _names
+    _plans, _names = plans, names
+
+
+def _score_job(geometry):
+    return score(_plans, _names, geometry)
+
+
+# candidate geometries for the tuned primitives: uniform over the ranges
+# without a best setting, otherwise normally spread around it
+def sample(rng, names, count, best=None, spread=SPREAD):
+    candidates = []
+    for _ in range(count):
+        geometry = defaults() if best is None else \
+            {name: dict(values) for name, values in best.items()}
+        for name in names:
+            for key, (low, high) in RANGES[name].items():
+                if best is None:
+                    value = rng.uniform(low, high)
+                else:
+                    value = rng.normal(best[name][key], spread * (high - low))
+                geometry[name][key] = round(float(np.clip(value, low, high)),
+                                            formations.DECIMALS)
+        candidates.append(geometry)
+    return candidates
+
+
+# best geometry for the planned show of an analysis, and its (score, terms).
+# only the primitives the show flies are tuned, the rest keep their defaults
+def tune(analysis, candidates=CANDIDATES, rounds=ROUNDS, processes=None,
+         seed=None):
+    plans = list(pipeline.plan(analysis))
+    names = primitive_names(plans)
+    tuned = sorted(set(name for name in names if name is not None))
+    rng = np.random.default_rng(seed)
+
+    best = defaults()
+    best_score = score(plans, names, best)
+    if not tuned:
+        return best, best_score
+
+    with Pool(processes, initializer=_init, initargs=(plans, names)) as pool:
+        for round_ in range(rounds):
+            spread = SPREAD / 2 ** (round_ - 1) if round_ else SPREAD
+            geometries = sample(rng, tuned, candidates,
+                                best if round_ else None, spread)
+            for geometry, result in zip(geometries,
+                                        pool.map(_score_job, geometries)):
+                if result[0] < best_score[0]:
+                    best, best_score = geometry, result
+            print('Round {}: best score {:.2f}'.format(round_ + 1,
+                                                       best_score[0]))
+    return best, best_score
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'audio_analysis.json'
+    with open(path, 'r') as analysis_file:
+        analysis = json.load(analysis_file)
+
+    started = time.perf_counter()
+    plans = list(pipeline.plan(analysis))
+    names = primitive_names(plans)
+    print('Hand-picked geometry: score {:.2f} {}'.format(
+        *score(plans, names, defaults())))
+    geometry, (total, terms) = tune(analysis)
+    print('Tuned geometry: score {:.2f} {} in {:.1f}s'.format(
+        total, terms, time.perf_counter() - started))
+    for name in sorted(set(name for name in names if name is not None)):
+        print('#### {}'.format(name))
+        for key, value in geometry[name].items():
+            print('{} = {}'.format(key, value))